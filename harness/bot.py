@@ -1,32 +1,113 @@
 import asyncio
-import datetime
+import collections
+import concurrent.futures
+import graphlib
 import importlib.machinery
 import importlib.util
 import inspect
 import itertools
 import logging
+import os
 import shutil
 import sys
+from collections.abc import Awaitable, Callable, Iterable
 from pathlib import Path
-from types import TracebackType
+from types import ModuleType, TracebackType
 from typing import Any
 
 import discord
 import strictyaml
 from discord.ext import commands
 
-from harness.components.config import DEFAULT_CONFIG_FILE_NAME, StraponConfig
-from harness.components.strapon import RequirementInstallSuccessError, Strapon, StraponMetadata
+from harness.components.config import DEFAULT_CONFIG_FILE_NAME, ConfigSnapshotCache, StraponConfig
+from harness.components.lazy import LazyStrapon
+from harness.components.log_commands import LogCommands
+from harness.components.profiling import LoadProfiler
+from harness.components.requirements import (
+    RequirementCache,
+    find_unsatisfied,
+    install_requirements,
+    invalidate_installed_versions,
+)
+from harness.components.strapon import (
+    RequirementInstallSuccessError,
+    Strapon,
+    StraponMetadata,
+    StraponMetadataCache,
+)
+from harness.components.watcher import StraponWatcher
 from harness.internal_utils import IndentFormatter
+from harness.logs import (
+    JsonLogHandler,
+    QueuedLogging,
+    RateLimitFilter,
+    RingBufferHandler,
+    RotatingLogHandler,
+    capture_log_context,
+    log_context,
+)
+
+LOG_LEVELS = ("DEBUG", "INFO", "WARNING", "ERROR", "CRITICAL")
 
 BOT_CONFIG_SCHEMA = strictyaml.Map({
     "token": strictyaml.Str(),
     "prefix_or_mention": strictyaml.Bool(),
     "prefixes": strictyaml.UniqueSeq(strictyaml.Str()),
     "enabled_strapons": strictyaml.UniqueSeq(strictyaml.Str()),
+    strictyaml.Optional("import_workers", default=0): strictyaml.Int(),
+    strictyaml.Optional("hot_reload", default=False): strictyaml.Bool(),
+    strictyaml.Optional("blue_green_reload", default=False): strictyaml.Bool(),
+    strictyaml.Optional("live_config_reload", default=False): strictyaml.Bool(),
+    strictyaml.Optional("config_save_delay", default=0.0): strictyaml.Float(),
+    strictyaml.Optional("queued_logging", default=False): strictyaml.Bool(),
+    strictyaml.Optional("log_max_size", default=0.0): strictyaml.Float(),
+    strictyaml.Optional("log_rotate_daily", default=False): strictyaml.Bool(),
+    strictyaml.Optional("log_retention", default=0): strictyaml.Int(),
+    strictyaml.Optional("log_compression", default=False): strictyaml.Bool(),
+    strictyaml.Optional("json_logging", default=False): strictyaml.Bool(),
+    strictyaml.Optional("log_dedup_interval", default=0.0): strictyaml.Float(),
+    strictyaml.Optional("log_rate_limit", default=0.0): strictyaml.Float(),
+    strictyaml.Optional("log_rate_burst", default=20): strictyaml.Int(),
+    strictyaml.Optional("log_level", default="DEBUG"): strictyaml.Enum(LOG_LEVELS),
+    strictyaml.Optional("strapon_log_levels", default={}): (
+        strictyaml.EmptyDict() | strictyaml.MapPattern(strictyaml.Str(), strictyaml.Enum(LOG_LEVELS))
+    ),
+    strictyaml.Optional("strapon_log_files", default=[]): (
+        strictyaml.EmptyList() | strictyaml.UniqueSeq(strictyaml.Str())
+    ),
+    strictyaml.Optional("log_buffer_size", default=0): strictyaml.Int(),
+    strictyaml.Optional("lazy_strapons", default=[]): strictyaml.EmptyList() | strictyaml.UniqueSeq(strictyaml.Str()),
+    strictyaml.Optional("background_loading", default=False): strictyaml.Bool(),
+    strictyaml.Optional("event_buffer_size", default=1000): strictyaml.Int(),
 })
 
 
+def _purge_module(key: str, lib: ModuleType) -> None:
+    """Remove a module and any submodules it left behind from ``sys.modules``.
+
+    The entry for ``key`` is only removed if it still points at ``lib``, so a concurrent import of the same name
+    doesn't get clobbered.
+    """
+    if sys.modules.get(key) is lib:
+        del sys.modules[key]
+    for module in tuple(sys.modules):
+        if module.startswith(f"{key}."):
+            sys.modules.pop(module, None)
+
+
+def _file_log_formatter() -> IndentFormatter:
+    return IndentFormatter(logging.Formatter(
+        fmt="{asctime} [{levelname}] {name}: {message}",
+        datefmt="%Y-%m-%d %H:%M:%S",
+        style="{",
+    ))
+
+
+def _strapon_id(import_name: str) -> str:
+    # Strapon IDs are enforced to match their package name
+    return import_name.rpartition(".")[2]
+
+
 class HarnessBot(commands.Bot):
     logger = logging.getLogger(__name__)
 
@@ -44,10 +125,34 @@ class HarnessBot(commands.Bot):
         self.logs_dir = self.data_dir / "logs"
         self.logs_dir.mkdir(parents=True, exist_ok=True)
 
+        self.cache_dir = self.data_dir / "cache"
+        self.strapon_metadata = StraponMetadataCache(self.cache_dir / "strapon_metadata.json")
+        self.requirement_cache = RequirementCache(self.cache_dir / "requirements.json")
+        self.config_snapshots = ConfigSnapshotCache(self.cache_dir / "config")
+
         self.bot_config_file = self.data_dir / "config.yml"
         self.bot_config: StraponConfig = StraponConfig(BOT_CONFIG_SCHEMA)
 
         self._registered_strapons: dict[str, Strapon] = {}
+        # Which strapon each loaded cog belongs to, for the log context of commands
+        self._cog_strapons: dict[commands.Cog, str] = {}
+        # Eagerly loaded strapons, kept even when a reload fails so the watcher can retry them
+        self._watched_strapons: set[str] = set()
+        self._lazy_strapons: dict[str, LazyStrapon] = {}
+        self._pending_strapons: dict[str, asyncio.Future[bool]] = {}
+        self._strapon_watcher: StraponWatcher | None = None
+        self._reload_lock = asyncio.Lock()
+        self._import_executor: concurrent.futures.ThreadPoolExecutor | None = None
+        self.load_profiler = LoadProfiler()
+        self._strapon_loading_task: asyncio.Task[None] | None = None
+        self._event_buffer: collections.deque[tuple[str, tuple[Any, ...], dict[str, Any]]] | None = None
+        self._dropped_event_count = 0
+        self._queued_logging = QueuedLogging()
+        self._strapon_queued_logging: list[QueuedLogging] = []
+        self._log_file_handler: RotatingLogHandler | None = None
+        self._json_log_handler: JsonLogHandler | None = None
+        self._log_rate_limit_filter: RateLimitFilter | None = None
+        self.log_buffer: RingBufferHandler | None = None
 
     async def start(self, *_, **__) -> None:
         if not self.bot_config_file.is_file():
@@ -60,8 +165,11 @@ class HarnessBot(commands.Bot):
             await self.close()
             return
 
+        # Not snapshotted, as it's small and holds the bot token
         await self.bot_config.load(self.bot_config_file)
+        await self.config_snapshots.discard(self.bot_config_file)  # Left behind by older versions
         assert self.bot_config.data is not None, "Bot config failed to load without error?"
+        self.configure_logging()
 
         self.command_prefix = (
             commands.when_mentioned_or(*self.bot_config.data["prefixes"])
@@ -76,11 +184,156 @@ class HarnessBot(commands.Bot):
         super().run(token="", log_handler=None)
 
     async def setup_hook(self) -> None:  # Called in client.login(), which gets called by start()
+        assert self.bot_config.data is not None, "Bot config not loaded?"
+        if self.log_buffer is not None:
+            await self.add_cog(LogCommands(self.log_buffer))
+        if not self.bot_config.data.get("background_loading", False):
+            await self._equip_strapons()
+            return
+        # Events are held back until strapons are loaded, so their listeners don't miss anything
+        self._event_buffer = collections.deque(maxlen=self.bot_config.data.get("event_buffer_size", 1000))
+        self._strapon_loading_task = asyncio.create_task(
+            self._equip_strapons_in_background(),
+            name="harness: strapon loading",
+        )
+
+    async def _equip_strapons(self) -> None:
         await self.load_all_strapons()
+        assert self.bot_config.data is not None, "Bot config not loaded?"
+        if self.bot_config.data.get("hot_reload", False):
+            self._strapon_watcher = StraponWatcher(self)
+            self._strapon_watcher.start()
+
+    async def _equip_strapons_in_background(self) -> None:
+        try:
+            await self._equip_strapons()
+        except Exception as error:
+            self.logger.exception("Failed to equip strapons", exc_info=error)
+        finally:
+            self._replay_buffered_events()
+
+    def _replay_buffered_events(self) -> None:
+        buffered, self._event_buffer = self._event_buffer, None
+        if not buffered:
+            return
+        if self._dropped_event_count:
+            self.logger.warning(
+                f"Event buffer overflowed while equipping strapons, dropped {self._dropped_event_count} events.",
+            )
+            self._dropped_event_count = 0
+        self.logger.debug(f"Replaying {len(buffered)} events received while equipping strapons.")
+        for event_name, args, kwargs in buffered:
+            super().dispatch(event_name, *args, **kwargs)
+
+    def dispatch(self, event_name: str, /, *args: Any, **kwargs: Any) -> None:
+        if self._event_buffer is not None:
+            if len(self._event_buffer) == self._event_buffer.maxlen:
+                self._dropped_event_count += 1
+            self._event_buffer.append((event_name, args, kwargs))
+            return
+        for lazy_strapon in self._lazy_strapons.values():
+            lazy_strapon.forward_event(f"on_{event_name}", args)
+        super().dispatch(event_name, *args, **kwargs)
+
+    async def invoke(self, ctx: commands.Context[Any]) -> None:
+        if self._json_log_handler is None:  # Nothing else shows the context
+            await super().invoke(ctx)
+            return
+        with log_context(
+            guild_id=ctx.guild.id if ctx.guild is not None else None,
+            channel_id=ctx.channel.id,
+            user_id=ctx.author.id,
+            command=ctx.command.qualified_name if ctx.command is not None else None,
+            command_strapon=self._cog_strapons.get(ctx.cog) if ctx.cog is not None else None,
+        ):
+            await super().invoke(ctx)
 
     async def close(self) -> None:
         self.logger.info("Shutting down bot.")
+        if self._strapon_loading_task is not None and not self._strapon_loading_task.done():
+            self._strapon_loading_task.cancel()
+        if self._strapon_watcher is not None:
+            self._strapon_watcher.stop()
+        if self._import_executor is not None:
+            self._import_executor.shutdown(wait=False, cancel_futures=True)
+            self._import_executor = None
+        await asyncio.gather(*(
+            strapon.config.flush()
+            for strapon in self._registered_strapons.values()
+            if strapon.config is not None
+        ))
         await super().close()
+        if self._log_rate_limit_filter is not None:
+            self._log_rate_limit_filter.flush()
+        self._queued_logging.stop()
+        for queued_logging in self._strapon_queued_logging:
+            queued_logging.stop()
+
+    def configure_logging(self) -> None:
+        """Apply the logging options of the bot config, on top of what :meth:`setup_bot_logging` set up."""
+        assert self.bot_config.data is not None, "Bot config not loaded?"
+        bot_config = self.bot_config.data
+        # Logger levels are checked before a record is even created, unlike handler levels
+        logging.getLogger().setLevel(bot_config.get("log_level", "DEBUG"))
+        for strapon_id, level in bot_config.get("strapon_log_levels", {}).items():
+            self.logger.getChild(strapon_id).setLevel(level)
+
+        if bot_config.get("json_logging", False) and self._json_log_handler is None:
+            self._json_log_handler = JsonLogHandler(self.logs_dir / "json", self.logger.name)
+            logging.getLogger().addHandler(self._json_log_handler)
+            capture_log_context()
+        if (log_buffer_size := bot_config.get("log_buffer_size", 0)) > 0 and self.log_buffer is None:
+            self.log_buffer = RingBufferHandler(log_buffer_size, self.logger.name)
+            logging.getLogger().addHandler(self.log_buffer)
+        strapon_handlers = self._add_strapon_log_files(bot_config.get("strapon_log_files", []))
+        for handler in (self._log_file_handler, self._json_log_handler, *strapon_handlers):
+            if handler is not None:
+                handler.configure(
+                    max_bytes=int(bot_config.get("log_max_size", 0) * 1024 * 1024),
+                    rotate_daily=bot_config.get("log_rotate_daily", False),
+                    retention=bot_config.get("log_retention", 0),
+                    compress=bot_config.get("log_compression", False),
+                )
+        # Last, so the handlers above end up behind the queue too
+        if bot_config.get("queued_logging", False):
+            self._queued_logging.start()
+            for handler in strapon_handlers:
+                queued_logging = QueuedLogging(logging.getLogger(handler.name))
+                queued_logging.start()
+                self._strapon_queued_logging.append(queued_logging)
+
+        dedup_interval = bot_config.get("log_dedup_interval", 0)
+        rate_limit = bot_config.get("log_rate_limit", 0)
+        if (dedup_interval or rate_limit) and self._log_rate_limit_filter is None:
+            self._log_rate_limit_filter = RateLimitFilter(
+                dedup_interval=dedup_interval,
+                rate=rate_limit,
+                burst=bot_config.get("log_rate_burst", 20),
+            )
+            # With queued logging, these are the queue handlers, so held back records don't even get queued
+            strapon_loggers = (logging.getLogger(handler.name) for handler in strapon_handlers)
+            for logger in (logging.getLogger(), *strapon_loggers):
+                for handler in logger.handlers:
+                    handler.addFilter(self._log_rate_limit_filter)
+
+    def _add_strapon_log_files(self, strapon_ids: Iterable[str]) -> list[RotatingLogHandler]:
+        """Give strapons their own log file in ``logs/strapons/<id>``, besides the main one.
+
+        The handlers are named after the logger they're attached to.
+        """
+        handlers: list[RotatingLogHandler] = []
+        for strapon_id in strapon_ids:
+            logger = self.logger.getChild(strapon_id)
+            if any(isinstance(handler, RotatingLogHandler) for handler in logger.handlers):
+                continue
+            log_dir = self.logs_dir / "strapons" / strapon_id
+            log_dir.mkdir(parents=True, exist_ok=True)
+            handler = RotatingLogHandler(log_dir)
+            handler.set_name(logger.name)
+            handler.setFormatter(_file_log_formatter())
+            logger.addHandler(handler)
+            handlers.append(handler)
+        return handlers
 
     def setup_bot_logging(self) -> None:
         # ty andrew for writing ost of this, so I don't need to <3
@@ -91,32 +344,10 @@ class HarnessBot(commands.Bot):
         # noinspection PyProtectedMember
         discord.utils.setup_logging(formatter=IndentFormatter(discord.utils._ColourFormatter()))
 
-        timestamp_format = "%Y-%m-%d"
-        timestamp_length = len(datetime.date.today().strftime(timestamp_format))
-
-        latest_log_file = self.logs_dir / "latest.log"
-        if latest_log_file.is_file():
-            with latest_log_file.open(encoding="utf-8") as file:
-                date_str = file.read(timestamp_length)
-            try:
-                datetime.datetime.strptime(date_str, timestamp_format).date()
-            except ValueError:
-                logging.warning(f"Invalid timestamp in log file: {date_str}")
-                date_str = "INVALID"
-
-            for log_number in itertools.count(start=1):
-                timestamp_log_path = self.logs_dir / f"{date_str}.{log_number}.log"
-                if not timestamp_log_path.is_file():
-                    latest_log_file.rename(timestamp_log_path)
-                    break
-
+        self._log_file_handler = RotatingLogHandler(self.logs_dir)
         discord.utils.setup_logging(
-            handler=logging.FileHandler(latest_log_file, "w", encoding="utf-8"),
-            formatter=IndentFormatter(logging.Formatter(
-                fmt="{asctime} [{levelname}] {name}: {message}",
-                datefmt="%Y-%m-%d %H:%M:%S",
-                style="{",
-            )),
+            handler=self._log_file_handler,
+            formatter=_file_log_formatter(),
         )
 
         logging.getLogger().setLevel(logging.DEBUG)
@@ -128,7 +359,8 @@ class HarnessBot(commands.Bot):
         if name in self._BotBase__extensions:  # pyright: ignore [reportAttributeAccessIssue]
             raise commands.errors.ExtensionAlreadyLoaded(name)
 
-        spec = importlib.util.find_spec(name)
+        with self.load_profiler.phase(_strapon_id(name), "find_spec"):
+            spec = importlib.util.find_spec(name)
         if spec is None:
             raise commands.errors.ExtensionNotFound(name)
 
@@ -138,37 +370,78 @@ class HarnessBot(commands.Bot):
             self.logger.debug(f"Requirements installed for {name}. Re-importing.")
             await self._load_from_module_spec(spec, name)
 
-    # noinspection PyDefaultArgument
-    async def _load_from_module_spec(
+    def _get_import_executor(self) -> concurrent.futures.ThreadPoolExecutor | None:
+        """Get the thread pool used to execute strapon modules, or None if imports should run on the event loop."""
+        if self._import_executor is not None:
+            return self._import_executor
+        workers = self.bot_config.data.get("import_workers", 0) if self.bot_config.data is not None else 0
+        if workers <= 0:
+            return None
+        self._import_executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=workers,
+            thread_name_prefix="harness-import",
+        )
+        return self._import_executor
+
+    async def _exec_module(self, spec: importlib.machinery.ModuleSpec, lib: ModuleType) -> None:
+        assert spec.loader is not None, f"Module spec for {spec.name} has no loader."
+        loader = spec.loader
+
+        # Timed where it runs, so waiting for a free worker doesn't count towards it
+        def exec_module() -> None:
+            with self.load_profiler.phase(_strapon_id(spec.name), "exec_module"):
+                loader.exec_module(lib)
+
+        executor = self._get_import_executor()
+        if executor is None:
+            exec_module()
+            return
+        await asyncio.get_running_loop().run_in_executor(executor, exec_module)
+
+    async def _import_strapon_module(
         self,
         spec: importlib.machinery.ModuleSpec,
         key: str,
-    ) -> None:
-        # precondition: key not in self.__extensions
+    ) -> tuple[ModuleType, Callable[["HarnessBot"], Awaitable[Strapon | Any]]]:
+        """Execute a strapon module and find its setup function, registering it in ``sys.modules`` under ``key``.
+
+        :return: The module and its setup function.
+        """
         lib = importlib.util.module_from_spec(spec)
         sys.modules[key] = lib
         try:
-            spec.loader.exec_module(lib)  # pyright: ignore [reportOptionalMemberAccess]
+            await self._exec_module(spec, lib)
         except Exception as error:
-            del sys.modules[key]
+            _purge_module(key, lib)
             raise commands.errors.ExtensionFailed(key, error) from error
 
         try:
             setup_func = lib.setup
         except AttributeError:
-            del sys.modules[key]
+            _purge_module(key, lib)
             raise commands.errors.NoEntryPointError(key)  # noqa: B904 Pulled straight from d.py, I literally don't care
         if not inspect.iscoroutinefunction(setup_func):
-            del sys.modules[key]
+            _purge_module(key, lib)
             raise commands.errors.ExtensionFailed(key, ValueError("setup() must be a coroutine"))
+        return lib, setup_func
+
+    # noinspection PyDefaultArgument
+    async def _load_from_module_spec(
+        self,
+        spec: importlib.machinery.ModuleSpec,
+        key: str,
+    ) -> None:
+        # precondition: key not in self.__extensions
+        lib, setup_func = await self._import_strapon_module(spec, key)
 
         try:
-            ret_value: Strapon | Any = await setup_func(self)
+            with self.load_profiler.phase(_strapon_id(key), "setup"):
+                ret_value: Strapon | Any = await setup_func(self)
             if not isinstance(ret_value, Strapon):
                 raise ValueError(f"Setup function for {key} did not return a {Strapon.__name__}.")
             await ret_value.load()
         except Exception as error:
-            del sys.modules[key]
+            _purge_module(key, lib)
             await self._remove_module_references(lib.__name__)
             await self._call_module_finalizers(lib, key)
             if isinstance(error, RequirementInstallSuccessError):
@@ -177,42 +450,427 @@ class HarnessBot(commands.Bot):
         else:
             # noinspection PyUnresolvedReferences
             self._BotBase__extensions[key] = lib  # pyright: ignore [reportAttributeAccessIssue]
+            self._registered_strapons[ret_value.metadata.id] = ret_value
+            self._cog_strapons.update(dict.fromkeys(ret_value.cogs, ret_value.metadata.id))
             self.logger.info(f"Loaded strapon: {ret_value.metadata.id!r}")
 
-    async def load_all_strapons(self) -> None:
+    async def install_all_requirements(self, strapons: Iterable[StraponMetadata]) -> None:
+        """Install the missing requirements of several strapons in one go, before any of them are imported.
+
+        If the batched install fails, each strapon falls back to installing its own requirements when loaded.
+        """
+        await self.requirement_cache.load()
+        unchecked = [
+            meta for meta in strapons
+            if not self.requirement_cache.is_satisfied(meta.id, meta.requirements)
+        ]
+        if not unchecked:
+            self.logger.debug("Strapon requirements unchanged since last check, skipping.")
+            return
+
+        invalidate_installed_versions()  # Pick up anything installed since the last load cycle
+        # Rebuilding the index of installed distributions scans site-packages, so keep it off the event loop
+        missing = await asyncio.to_thread(
+            find_unsatisfied,
+            list(itertools.chain.from_iterable(meta.requirements for meta in unchecked)),
+        )
+        if missing:
+            try:
+                await install_requirements(missing, self.logger)
+            except Exception as error:
+                self.logger.warning(
+                    "Failed to install strapon requirements in bulk, falling back to installing them per strapon.",
+                    exc_info=error,
+                )
+                return
+            self.requirement_cache.invalidate()
+
+        for meta in unchecked:
+            self.requirement_cache.mark_satisfied(meta.id, meta.requirements)
+        await self.requirement_cache.save()
+
+    def register_lazy_strapons(self, strapons: Iterable[StraponMetadata]) -> set[StraponMetadata]:
+        """Register placeholders for the strapons configured to load lazily, instead of loading them.
+
+        :return: The strapons which were deferred.
+        """
+        assert self.bot_config.data is not None, "Bot config not loaded?"
+        lazy_ids = self.bot_config.data.get("lazy_strapons", [])
+        deferred: set[StraponMetadata] = set()
+        for meta in strapons:
+            if meta.id not in lazy_ids:
+                continue
+            if not meta.lazy_commands and not meta.lazy_events:
+                self.logger.warning(f"Strapon {meta.id!r} declares no lazy commands or events. Loading it eagerly.")
+                continue
+            lazy_strapon = LazyStrapon(self, meta)
+            try:
+                lazy_strapon.register()
+            except commands.CommandRegistrationError as error:
+                self.logger.warning(f"Can't defer strapon {meta.id!r}, loading it eagerly: {error}")
+                continue
+            self._lazy_strapons[meta.id] = lazy_strapon
+            deferred.add(meta)
+        if deferred:
+            self.logger.info("Deferred loading of lazy strapons: " + ", ".join(meta.id for meta in deferred))
+        return deferred
+
+    async def unload_extension(self, name: str, *, package: str | None = None) -> None:
+        name = self._resolve_name(name, package)
+        await super().unload_extension(name)
+        for strapon_id, strapon in tuple(self._registered_strapons.items()):
+            if strapon.metadata.import_name == name:
+                del self._registered_strapons[strapon_id]
+                self._watched_strapons.discard(strapon_id)
+                for cog in strapon.cogs:
+                    self._cog_strapons.pop(cog, None)
+                await strapon.unload()
+
+    def get_strapon(self, strapon_id: str) -> Strapon | None:
+        return self._registered_strapons.get(strapon_id)
+
+    def is_strapon_loaded(self, strapon_id: str) -> bool:
+        return strapon_id in self._registered_strapons
+
+    def is_strapon_watched(self, strapon_id: str) -> bool:
+        """Whether a strapon should be reloaded when its files change, including after its last load failed."""
+        return strapon_id in self._watched_strapons or strapon_id in self._registered_strapons
+
+    async def reload_strapon(self, strapon_id: str, *, blue_green: bool | None = None) -> None:
+        """Reload a strapon from disk.
+
+        A watched strapon which isn't loaded, because its last load or reload failed, is loaded from scratch.
+
+        :param strapon_id: The ID of the loaded strapon to reload.
+        :param blue_green: Whether to set up the new version next to the old one and only swap their cogs once it
+            succeeded, instead of unloading first. Defaults to the ``blue_green_reload`` bot config option.
+        """
+        async with self._reload_lock:
+            strapon = self._registered_strapons.get(strapon_id)
+            if strapon is None:
+                if strapon_id not in self._watched_strapons:
+                    raise commands.errors.ExtensionNotLoaded(strapon_id)
+                metadata = await asyncio.to_thread(self.strapon_metadata.get, self.strapons_dir.resolve() / strapon_id)
+                importlib.invalidate_caches()
+                await self.load_extension(metadata.import_name)
+                return
+            if blue_green is None:
+                blue_green = self.bot_config.data is not None and self.bot_config.data.get("blue_green_reload", False)
+
+            # Pick up changes to pyproject.toml before the strapon reads its metadata again
+            await asyncio.to_thread(self.strapon_metadata.get, strapon.package_dir)
+            importlib.invalidate_caches()
+            if blue_green:
+                await self._blue_green_reload(strapon)
+            else:
+                await self.unload_extension(strapon.metadata.import_name)  # Also drops submodules from sys.modules
+                self._watched_strapons.add(strapon_id)  # So a broken version gets retried once it's fixed
+                await self.load_extension(strapon.metadata.import_name)
+
+    def _module_references(self, key: str) -> tuple[list[commands.Command], list[tuple[str, Callable[..., Any]]]]:
+        """Get the commands and listeners a strapon's modules registered on the bot directly, outside of cogs."""
+        def from_module(module: str | None) -> bool:
+            return module is not None and (module == key or module.startswith(f"{key}."))
+
+        bot_commands = [
+            command for command in self.all_commands.values()
+            if command.cog is None and from_module(command.module)
+        ]
+        listeners = [
+            (event, listener)
+            for event, event_listeners in self.extra_events.items()
+            for listener in event_listeners
+            if not isinstance(getattr(listener, "__self__", None), commands.Cog)
+            and from_module(getattr(listener, "__module__", None))
+        ]
+        return list(dict.fromkeys(bot_commands)), listeners  # Aliases map to the same command
+
+    def _remove_references(
+        self,
+        references: tuple[list[commands.Command], list[tuple[str, Callable[..., Any]]]],
+    ) -> None:
+        """Remove the given commands and listeners, by identity, so same-named ones from another version stay."""
+        bot_commands, listeners = references
+        for command in bot_commands:
+            if self.all_commands.get(command.name) is command:
+                self.remove_command(command.name)
+        for event, listener in listeners:
+            event_listeners = self.extra_events.get(event, [])
+            for index, registered in enumerate(event_listeners):
+                if registered is listener:
+                    del event_listeners[index]
+                    break
+
+    def _restore_references(
+        self,
+        references: tuple[list[commands.Command], list[tuple[str, Callable[..., Any]]]],
+    ) -> None:
+        """Add back commands and listeners removed with :meth:`_remove_references`."""
+        bot_commands, listeners = references
+        for command in bot_commands:
+            if command.name not in self.all_commands:
+                self.add_command(command)
+        for event, listener in listeners:
+            self.add_listener(listener, event)
+
+    async def _run_teardown(self, lib: ModuleType, strapon_id: str) -> None:
+        if inspect.iscoroutinefunction(teardown := getattr(lib, "teardown", None)):
+            try:
+                await teardown(self)
+            except Exception as error:
+                self.logger.exception(f"Teardown of {strapon_id!r} failed", exc_info=error)
+
+    async def _prepare_strapon_module(
+        self,
+        spec: importlib.machinery.ModuleSpec,
+        key: str,
+    ) -> tuple[ModuleType, Strapon]:
+        """Import and set up a strapon, without adding its cogs to the bot.
+
+        If setting up fails, whatever the new module registered directly on the bot is removed and its teardown is
+        called, without touching what an already loaded version registered.
+        """
+        existing_commands, existing_listeners = self._module_references(key)
+        lib, setup_func = await self._import_strapon_module(spec, key)
+        try:
+            with self.load_profiler.phase(_strapon_id(key), "setup"):
+                strapon: Strapon | Any = await setup_func(self)
+            if not isinstance(strapon, Strapon):
+                raise ValueError(f"Setup function for {key} did not return a {Strapon.__name__}.")
+            await strapon.prepare()
+        except Exception as error:
+            new_commands, new_listeners = self._module_references(key)
+            self._remove_references((
+                [command for command in new_commands if command not in existing_commands],
+                [listener for listener in new_listeners if listener not in existing_listeners],
+            ))
+            await self._run_teardown(lib, _strapon_id(key))
+            _purge_module(key, lib)
+            if isinstance(error, RequirementInstallSuccessError):
+                raise error
+            raise commands.errors.ExtensionFailed(key, error) from error
+        return lib, strapon
+
+    async def _swap_strapon_cogs(self, old_strapon: Strapon, new_strapon: Strapon) -> None:
+        """Replace the cogs of one strapon with those of another, putting the old cogs back if anything fails."""
+        added: list[commands.Cog] = []
+        try:
+            # Same-named cogs get overridden in place, so their commands are never missing
+            for cog in new_strapon.cogs:
+                await self.add_cog(cog, override=True)
+                added.append(cog)
+            new_names = {cog.qualified_name for cog in new_strapon.cogs}
+            for cog in old_strapon.cogs:
+                if cog.qualified_name not in new_names and self.get_cog(cog.qualified_name) is cog:
+                    await self.remove_cog(cog.qualified_name)
+        except Exception:
+            for cog in added:
+                if self.get_cog(cog.qualified_name) is cog:
+                    await self.remove_cog(cog.qualified_name)
+            for cog in old_strapon.cogs:
+                if self.get_cog(cog.qualified_name) is None:
+                    await self.add_cog(cog)
+            raise
+
+    async def _blue_green_reload(self, old_strapon: Strapon) -> None:
+        key = old_strapon.metadata.import_name
+        old_lib = self.extensions[key]
+        old_modules = {
+            name: module for name, module in sys.modules.items()
+            if name == key or name.startswith(f"{key}.")
+        }
+
+        def restore_old_modules() -> None:
+            for name in tuple(sys.modules):
+                if name == key or name.startswith(f"{key}."):
+                    del sys.modules[name]
+            sys.modules.update(old_modules)
+
+        # The new version reads its config from disk, so saves held back by the old one have to land first
+        if old_strapon.config is not None:
+            await old_strapon.config.flush()
+
+        # The old version's teardown runs and the commands and listeners it registered outside of cogs are removed
+        # (by identity, as the new ones share their module names) before the new version is set up. That way neither
+        # clashes with the new version, nor can a teardown removing things by name hit it. Its cogs stay until the
+        # swap, so its commands are never missing.
+        old_references = self._module_references(key)
+        await self._run_teardown(old_lib, old_strapon.metadata.id)
+        self._remove_references(old_references)
+
+        async def roll_back() -> None:
+            restore_old_modules()
+            self._restore_references(old_references)
+            for cog in old_strapon.cogs:
+                if self.get_cog(cog.qualified_name) is None:
+                    await self.add_cog(cog)
+            self.logger.warning(
+                f"Rolled back to the old version of {old_strapon.metadata.id!r}. "
+                "Its teardown already ran, so it may not fully work until reloaded.",
+            )
+
+        # The old version keeps running off its existing module objects while the new one gets imported fresh
+        for name in old_modules:
+            del sys.modules[name]
+        try:
+            spec = importlib.util.find_spec(key)
+            if spec is None:
+                raise commands.errors.ExtensionNotFound(key)
+            try:
+                lib, new_strapon = await self._prepare_strapon_module(spec, key)
+            except RequirementInstallSuccessError:
+                self.logger.debug(f"Requirements installed for {key}. Re-importing.")
+                lib, new_strapon = await self._prepare_strapon_module(spec, key)
+        except BaseException:
+            await roll_back()
+            raise
+
+        try:
+            await self._swap_strapon_cogs(old_strapon, new_strapon)
+        except Exception as error:
+            self.logger.error(f"Failed to swap in new version of {old_strapon.metadata.id!r}.")
+            # The old version's references are gone at this point, so whatever is left came from the new one
+            self._remove_references(self._module_references(key))
+            await self._run_teardown(lib, new_strapon.metadata.id)
+            await roll_back()
+            raise commands.errors.ExtensionFailed(key, error) from error
+
+        await old_strapon.unload()
+        new_strapon.watch_config()
+        # noinspection PyUnresolvedReferences
+        self._BotBase__extensions[key] = lib  # pyright: ignore [reportAttributeAccessIssue]
+        self._registered_strapons[new_strapon.metadata.id] = new_strapon
+        for cog in old_strapon.cogs:
+            self._cog_strapons.pop(cog, None)
+        self._cog_strapons.update(dict.fromkeys(new_strapon.cogs, new_strapon.metadata.id))
+        self.logger.info(f"Reloaded strapon: {new_strapon.metadata.id!r}")
+
+    async def wait_for_strapon(self, strapon_id: str) -> bool:
+        """Wait until a strapon has finished loading, activating it if it is lazy.
+
+        :return: Whether the strapon is loaded. False if it failed or isn't being loaded at all.
+        """
+        if strapon_id in self._registered_strapons:
+            return True
+        if (pending := self._pending_strapons.get(strapon_id)) is not None:
+            return await asyncio.shield(pending)  # Cancelling one waiter shouldn't cancel the others
+        if (lazy_strapon := self._lazy_strapons.get(strapon_id)) is not None:
+            return await lazy_strapon.activate()
+        return False
+
+    @staticmethod
+    def _find_dependency_cycles(strapons: Iterable[StraponMetadata]) -> tuple[StraponMetadata, ...]:
+        """Find every strapon which is part of a dependency cycle."""
+        by_id = {meta.id: meta for meta in strapons}
+        cyclic: dict[str, None] = {}
+        # The sorter only reports one cycle at a time, so take it out of the graph and look again
+        while True:
+            sorter = graphlib.TopologicalSorter({
+                meta.id: [
+                    dependency for dependency in meta.strapon_dependencies
+                    if dependency in by_id and dependency not in cyclic
+                ]
+                for meta in by_id.values()
+                if meta.id not in cyclic
+            })
+            try:
+                sorter.prepare()
+            except graphlib.CycleError as error:
+                cyclic.update(dict.fromkeys(error.args[1]))
+            else:
+                return tuple(by_id[strapon_id] for strapon_id in cyclic)
+
+    def _discover_strapons(self) -> tuple[list[StraponMetadata], list[Path]]:
+        """Find and parse every strapon package, in a single scan of the strapon directory.
+
+        This does blocking IO and is meant to be run in an executor.
+
+        :return: The metadata of every strapon found, and the paths that were skipped for not being strapons.
+        """
         strapons_dir = self.strapons_dir.resolve()
         if not strapons_dir.is_dir():
             raise FileNotFoundError(f"Strapon directory not found at: {strapons_dir}")
 
+        discovered: list[StraponMetadata] = []
+        skipped: list[Path] = []
+        with os.scandir(strapons_dir) as entries:
+            for entry in entries:
+                if not entry.is_dir():
+                    skipped.append(Path(entry.path))
+                    continue
+                with os.scandir(entry.path) as package_entries:
+                    files = {package_entry.name for package_entry in package_entries if package_entry.is_file()}
+                if not {"__init__.py", "pyproject.toml"} <= files:
+                    skipped.append(Path(entry.path))
+                    continue
+                discovered.append(self.strapon_metadata.get(Path(entry.path)))
+        self.strapon_metadata.save()
+        return discovered, skipped
+
+    async def load_all_strapons(self) -> None:
         assert self.bot_config.data is not None and "enabled_strapons" in self.bot_config.data, "Bot config not loaded?"
 
-        potential_strapons: set[StraponMetadata] = set()
-        for subdir_path in strapons_dir.iterdir():
-            if (
-                not (subdir_path / "__init__.py").is_file()
-                or not (subdir_path / "pyproject.toml").is_file()
-            ):
-                self.logger.warning(f"Skipping non-strapon directory: {subdir_path}")
-                continue
-            metadata = StraponMetadata(subdir_path)
-            if metadata.id in self.bot_config.data["enabled_strapons"]:
-                potential_strapons.add(metadata)
+        self.load_profiler = LoadProfiler()
+        try:
+            await self._load_all_strapons()
+        finally:
+            if self.load_profiler.strapon_timings:
+                self.logger.info("Strapon load times (ms):\n" + self.load_profiler.summary_table())
+            await self.load_profiler.write_report(self.data_dir / "strapon_load_profile.json")
+
+    async def _load_all_strapons(self) -> None:
+        assert self.bot_config.data is not None, "Bot config not loaded?"
+        with self.load_profiler.phase(None, "discovery"):
+            discovered, skipped = await asyncio.to_thread(self._discover_strapons)
+        for path in skipped:
+            self.logger.warning(f"Skipping non-strapon directory: {path}")
+        potential_strapons = {
+            metadata for metadata in discovered
+            if metadata.id in self.bot_config.data["enabled_strapons"]
+        }
         if not potential_strapons:
             self.logger.debug("No strapons to equip.")
             return
 
+        with self.load_profiler.phase(None, "requirements"):
+            await self.install_all_requirements(potential_strapons)
+
         failed: set[StraponMetadata] = set()
+        for cycle_member in self._find_dependency_cycles(potential_strapons):
+            self.logger.error(f"Skipping strapon {cycle_member.id!r}, it is part of a dependency cycle.")
+            failed.add(cycle_member)
+
+        potential_strapons -= self.register_lazy_strapons(potential_strapons - failed)
+        if not potential_strapons:
+            return
+        self._watched_strapons.update(meta.id for meta in potential_strapons - failed)
+
+        loop = asyncio.get_running_loop()
+        for meta in potential_strapons - failed:
+            self._pending_strapons[meta.id] = loop.create_future()
+
         async def load_wrapper(meta: StraponMetadata) -> None:
+            loaded = False
             try:
+                for dependency in meta.strapon_dependencies:
+                    if not await self.wait_for_strapon(dependency):
+                        self.logger.error(f"Skipping strapon {meta.id!r}, dependency {dependency!r} is not available.")
+                        failed.add(meta)
+                        return
                 await self.load_extension(meta.import_name)
+                loaded = True
             except Exception as error:
                 self.logger.exception(f"Failed to equip strapon {meta.id!r}", exc_info=error)
                 failed.add(meta)
+            finally:
+                future = self._pending_strapons.pop(meta.id)
+                if not future.done():
+                    future.set_result(loaded)
 
-        self.logger.info(f"Equipping {len(potential_strapons)} strapons.")
+        self.logger.info(f"Equipping {len(potential_strapons - failed)} strapons.")
         await asyncio.gather(*(
             load_wrapper(metadata)
-            for metadata in potential_strapons
+            for metadata in potential_strapons - failed
         ))
         if len(potential_strapons - failed) > 0:
             self.logger.info(
@@ -1,39 +1,575 @@
+import asyncio
+import contextlib
+import copy
+import hashlib
+import inspect
+import json
+import keyword
+import logging
+import os
+import re
+import stat
+import tempfile
+from collections import OrderedDict, defaultdict
+from collections.abc import Awaitable, Callable
 from pathlib import Path
+from types import MappingProxyType
+from typing import Any, ClassVar
 
 import aiofiles
 import strictyaml
 
 DEFAULT_CONFIG_FILE_NAME = "default_config.yml"
 
+ConfigListener = Callable[[Any, Any], Awaitable[None] | None]
+_MISSING = object()
+
+
+def schema_fingerprint(schema: strictyaml.Validator) -> str:
+    """Get a string identifying a schema, including the defaults of its optional keys."""
+    def describe(value: Any) -> str:
+        if isinstance(value, strictyaml.Validator) and hasattr(value, "__dict__"):
+            return f"{type(value).__name__}({describe(vars(value))})"
+        if isinstance(value, dict):
+            return "{" + ", ".join(f"{describe(key)}: {describe(item)}" for key, item in value.items()) + "}"
+        if isinstance(value, list | tuple):
+            return "[" + ", ".join(map(describe, value)) + "]"
+        return repr(value)
+
+    return hashlib.sha256(f"{strictyaml.__version__}:{describe(schema)}".encode()).hexdigest()
+
+
+class ConfigSnapshotCache:
+    """Stores validated config data as JSON, so unchanged configs can skip strictyaml parsing.
+
+    Snapshots are keyed by the content of the config file and the identity of the schema it was validated against.
+    Configs containing values JSON can't represent exactly (like datetimes) are never cached.
+    """
+
+    def __init__(self, cache_dir: Path) -> None:
+        self.cache_dir = cache_dir
+
+    @staticmethod
+    def _key(schema: strictyaml.Validator, content: str) -> str:
+        return hashlib.sha256(f"{schema_fingerprint(schema)}\n{content}".encode()).hexdigest()
+
+    def _snapshot_file(self, config_path: Path) -> Path:
+        return self.cache_dir / (config_path.as_posix().replace("/", "_") + ".json")
+
+    async def get(self, config_path: Path, schema: strictyaml.Validator, content: str) -> dict | None:
+        """Get the validated data for a config file's content, or None if there is no up-to-date snapshot."""
+        try:
+            async with aiofiles.open(self._snapshot_file(config_path), "r", encoding="utf-8") as file:
+                snapshot = json.loads(await file.read())
+        except (OSError, ValueError):
+            return None
+        if not isinstance(snapshot, dict) or snapshot.get("key") != self._key(schema, content):
+            return None
+        return snapshot["data"]
+
+    async def put(self, config_path: Path, schema: strictyaml.Validator, content: str, data: dict) -> None:
+        try:
+            serialised = json.dumps({"key": self._key(schema, content), "data": data})
+        except (TypeError, ValueError):
+            return
+        if json.loads(serialised)["data"] != data:
+            return  # Something like a tuple or non-string key, which wouldn't survive the round trip
+        try:
+            # The snapshot holds the same data as the config, so it shouldn't be any more readable
+            mode = stat.S_IMODE((await asyncio.to_thread(config_path.stat)).st_mode)
+        except OSError:
+            return
+        await asyncio.to_thread(self.cache_dir.mkdir, parents=True, exist_ok=True)
+        await asyncio.to_thread(_write_atomic, self._snapshot_file(config_path), serialised, mode=mode)
+
+    async def discard(self, config_path: Path) -> None:
+        """Delete the snapshot of a config file, if there is one."""
+        await asyncio.to_thread(self._snapshot_file(config_path).unlink, missing_ok=True)
+
+
+def _changed_keys(old: Any, new: Any, prefix: str = "") -> set[str]:
+    """Get the dotted paths of every key that differs between two (possibly nested) mappings."""
+    if not isinstance(old, dict) or not isinstance(new, dict):
+        return set() if old == new else {prefix}
+    changed: set[str] = set()
+    for key in old.keys() | new.keys():
+        path = f"{prefix}.{key}" if prefix else str(key)
+        if key not in old or key not in new:
+            changed.add(path)
+        elif old[key] != new[key]:
+            changed |= _changed_keys(old[key], new[key], path) | {path}
+    return changed
+
+
+def _lookup(data: Any, path: str) -> Any:
+    for key in path.split("."):
+        if not isinstance(data, dict) or key not in data:
+            return _MISSING
+        data = data[key]
+    return data
+
+
+class ConfigView:
+    """Read-only attribute access to validated config data.
+
+    Subclasses are generated from a schema by :func:`view_type`, with one slot per key of the schema's map.
+    Nested maps become nested views, sequences become tuples and other mappings become read-only mappings.
+    """
+
+    __slots__ = ()
+    _fields: ClassVar[dict[str, tuple[str, type["ConfigView"] | None]]] = {}
+
+    def __init__(self, data: dict) -> None:
+        for attribute, (key, nested_type) in self._fields.items():
+            value = data.get(key)
+            frozen = nested_type(value) if nested_type is not None and isinstance(value, dict) else _freeze(value)
+            object.__setattr__(self, attribute, frozen)
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only.")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{type(self).__name__} is read-only.")
+
+    def __repr__(self) -> str:
+        attributes = ", ".join(f"{attribute}={getattr(self, attribute)!r}" for attribute in self._fields)
+        return f"{type(self).__name__}({attributes})"
+
+
+def _freeze(value: Any) -> Any:
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(map(_freeze, value))
+    return value
+
+
+def _attribute_name(key: str) -> str:
+    name = re.sub(r"\W", "_", key)
+    if keyword.iskeyword(name):
+        return f"{name}_"
+    if not name or name[0].isdigit():
+        return f"_{name}"
+    return name
+
+
+def view_type(schema: strictyaml.Map, name: str = "ConfigView") -> type[ConfigView]:
+    """Generate a slotted :class:`ConfigView` subclass for a map schema.
+
+    Keys which aren't valid identifiers have their invalid characters replaced with underscores.
+    """
+    fields: dict[str, tuple[str, type[ConfigView] | None]] = {}
+    # noinspection PyProtectedMember
+    for key, validator in schema._validator_dict.items():  # There's no public way to get a Map's keys
+        nested_type = view_type(validator, f"{name}_{key}") if isinstance(validator, strictyaml.Map) else None
+        fields[_attribute_name(key)] = (key, nested_type)
+    return type(name, (ConfigView,), {"__slots__": tuple(fields), "_fields": fields})
+
+
+def _write_atomic(path: Path, content: str, *, mode: int | None = None) -> None:
+    """Write a file through a temporary file which is then renamed into place, so it's never left half written.
+
+    :param mode: Permissions for the file. Defaults to those of the file being replaced, if any.
+    """
+    file_descriptor, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.name}.", suffix=".tmp")
+    try:
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            file.write(content)
+            file.flush()
+            os.fsync(file.fileno())
+        # mkstemp creates the file as 0600, keep the permissions of the file being replaced instead
+        with contextlib.suppress(FileNotFoundError):
+            os.chmod(temp_path, stat.S_IMODE(path.stat().st_mode) if mode is None else mode)  # noqa: PTH101
+        Path(temp_path).replace(path)
+    except BaseException:
+        Path(temp_path).unlink(missing_ok=True)
+        raise
+
 
 class StraponConfig:
-    def __init__(self, schema: strictyaml.Map) -> None:
+    logger = logging.getLogger(__name__)
+
+    def __init__(self, schema: strictyaml.Map, *, save_delay: float = 0) -> None:
+        """A config file validated against a schema.
+
+        :param schema: The schema to validate the config against.
+        :param save_delay: Seconds to wait before writing a save to disk, merging any further saves in that window.
+            0 saves immediately.
+        """
         self.schema = schema
+        self.save_delay = save_delay
+        self._pending_save_path: Path | None = None
+        self._save_task: asyncio.Task[None] | None = None
+        self._write_lock = asyncio.Lock()
         self._data: strictyaml.YAML | None = None
+        self._content: str | None = None
+        self._label: str | None = None
+        self._snapshot: dict | None = None
+        self._view_type = view_type(schema) if isinstance(schema, strictyaml.Map) else None
+        self.view: ConfigView | MappingProxyType | None = None
+        """A read-only view of the config, meant for fast attribute access in hot code. None until loaded."""
         self._config_path: Path | None = None
+        self._snapshot_cache: ConfigSnapshotCache | None = None
+        self._listeners: defaultdict[str, list[ConfigListener]] = defaultdict(list)
+        self._watch_task: asyncio.Task[None] | None = None
 
     @property
     def data(self) -> dict | None:
-        if self._data is None:
-            return None
-        assert isinstance(self._data.data, dict), "Config data is not a dict."
-        return self._data.data
+        return self._snapshot
 
-    async def load(self, config_path: Path) -> strictyaml.YAML:
-        async with aiofiles.open(config_path, "r", encoding="utf-8") as file:
-            data = strictyaml.load(
-                await file.read(),
-                schema=self.schema,
-                label=config_path.relative_to(Path()).as_posix(),
-            )
-        if not isinstance(data.data, dict):
+    def _parse(self, content: str, label: str) -> tuple[strictyaml.YAML, dict]:
+        """Parse and validate config content. Blocking, so it should be run in an executor.
+
+        :return: The parsed YAML document and its data.
+        """
+        document = strictyaml.load(content, schema=self.schema, label=label)
+        if not isinstance(data := document.data, dict):
             raise ValueError("Config data is not a dict.")
-        self._data = data
-        return data
+        return document, data
+
+    async def load(self, config_path: Path, snapshot_cache: ConfigSnapshotCache | None = None) -> None:
+        """Load and validate a config file.
+
+        :param config_path: The config file to load.
+        :param snapshot_cache: If given, validated data is taken from and stored in this cache.
+        """
+        async with aiofiles.open(config_path, "r", encoding="utf-8") as file:
+            content = await file.read()
+        label = config_path.relative_to(Path()).as_posix()
+
+        snapshot = None
+        if snapshot_cache is not None:
+            snapshot = await snapshot_cache.get(config_path, self.schema, content)
+        if snapshot is None:
+            # Parsing is slow for larger configs, so keep it off the event loop
+            self._data, snapshot = await asyncio.to_thread(self._parse, content, label)
+            if snapshot_cache is not None:
+                await snapshot_cache.put(config_path, self.schema, content, snapshot)
+        else:
+            self._data = None  # Parsed lazily, only if the config gets saved
+
+        self._content = content
+        self._label = label
+        self._snapshot = snapshot
+        self._snapshot_cache = snapshot_cache
+        self._rebuild_view()
+
+    def _rebuild_view(self) -> None:
+        if self._snapshot is None:
+            self.view = None
+        elif self._view_type is not None:
+            self.view = self._view_type(self._snapshot)
+        else:
+            self.view = _freeze(self._snapshot)
 
-    async def save(self, config_path: Path) -> None:
+    def add_listener(self, key: str, listener: ConfigListener) -> None:
+        """Call a function whenever the value of a key changes on reload.
+
+        :param key: The key to listen to. Nested keys are separated by dots, and listening to a key also catches
+            changes to anything nested in it.
+        :param listener: Called with the old and new value, which are None if the key is missing. Can be a coroutine.
+        """
+        self._listeners[key].append(listener)
+
+    def remove_listener(self, key: str, listener: ConfigListener) -> None:
+        self._listeners[key].remove(listener)
+
+    def on_change(self, key: str) -> Callable[[ConfigListener], ConfigListener]:
+        """Decorator version of :meth:`add_listener`."""
+        def decorator(listener: ConfigListener) -> ConfigListener:
+            self.add_listener(key, listener)
+            return listener
+        return decorator
+
+    async def changed_on_disk(self) -> bool:
+        """Whether the config file differs from what was last loaded or saved."""
+        if self._config_path is None:
+            raise ValueError("No config loaded.")
+        async with aiofiles.open(self._config_path, "r", encoding="utf-8") as file:
+            return await file.read() != self._content
+
+    async def reload(self) -> set[str]:
+        """Reload the config from disk, calling the listeners of every key that changed.
+
+        If the new config fails to validate, the error is logged and the current config is kept.
+
+        :return: The dotted paths of the keys that changed.
+        """
+        if self._config_path is None or self._snapshot is None:
+            raise ValueError("No config loaded.")
+        if not await self.changed_on_disk():
+            return set()
+
+        old_snapshot = self._snapshot
+        old_state = self._data, self._content, self._label, self._snapshot, self.view
+        try:
+            await self.load(self._config_path, self._snapshot_cache)
+        except Exception as error:
+            self._data, self._content, self._label, self._snapshot, self.view = old_state
+            self.logger.error(f"Invalid config at {self._config_path}, keeping the previous one:\n{error}")
+            return set()
+        assert self._snapshot is not None
+
+        changed = _changed_keys(old_snapshot, self._snapshot)
+        for key in changed & self._listeners.keys():
+            old, new = _lookup(old_snapshot, key), _lookup(self._snapshot, key)
+            for listener in tuple(self._listeners[key]):
+                try:
+                    result = listener(None if old is _MISSING else old, None if new is _MISSING else new)
+                    if inspect.isawaitable(result):
+                        await result
+                except Exception as error:
+                    self.logger.exception(f"Config listener for {key!r} failed", exc_info=error)
+        return changed
+
+    def watch(self, interval: float = 1) -> None:
+        """Start polling the config file, reloading it whenever it changes."""
+        if self._watch_task is None or self._watch_task.done():
+            self._watch_task = asyncio.create_task(self._watch(interval), name=f"harness: watch {self._label}")
+
+    def stop_watching(self) -> None:
+        if self._watch_task is not None:
+            self._watch_task.cancel()
+            self._watch_task = None
+
+    async def _watch(self, interval: float) -> None:
+        assert self._config_path is not None, "No config loaded."
+
+        async def get_mtime() -> int | None:
+            try:
+                return (await asyncio.to_thread(self._config_path.stat)).st_mtime_ns
+            except OSError:
+                return None
+
+        last_mtime = await get_mtime()
+        while True:
+            await asyncio.sleep(interval)
+            if (mtime := await get_mtime()) == last_mtime or mtime is None:
+                continue
+            last_mtime = mtime
+            try:
+                await self.reload()
+            except Exception as error:
+                self.logger.exception(f"Failed to reload config {self._config_path}", exc_info=error)
+
+    async def _get_document(self) -> strictyaml.YAML:
+        if self._content is None or self._label is None:
+            raise ValueError("No config loaded.")
         if self._data is None:
+            self._data, _ = await asyncio.to_thread(self._parse, self._content, self._label)
+        return self._data
+
+    async def set(self, key: str, value: Any) -> None:
+        """Set and validate the value of a key. Nested keys are separated by dots.
+
+        This only changes the loaded config, call :meth:`save` to write it to disk.
+        """
+        document = await self._get_document()
+        *parents, name = key.split(".")
+        for parent in parents:
+            document = document[parent]
+        document[name] = value  # strictyaml validates on assignment
+
+        assert self._snapshot is not None
+        snapshot = self._snapshot
+        for parent in parents:
+            snapshot = snapshot[parent]
+        snapshot[name] = document[name].data
+        self._rebuild_view()
+
+    async def save(self, config_path: Path | None = None) -> None:
+        """Save the config, atomically replacing the file.
+
+        If ``save_delay`` is set, the write is deferred by that many seconds and any saves in the meantime are merged
+        into it. Use :meth:`flush` to write a pending save immediately.
+
+        :param config_path: Where to save the config. Defaults to the path it's managed at.
+        """
+        config_path = config_path or self._config_path
+        if config_path is None:
+            raise ValueError("No config path to save to.")
+        if self.save_delay <= 0:
+            async with self._write_lock:
+                await self._write(config_path)
+            return
+
+        self._pending_save_path = config_path
+        if self._save_task is None or self._save_task.done():
+            self._save_task = asyncio.create_task(self._delayed_write(), name=f"harness: save {self._label}")
+
+    async def _delayed_write(self) -> None:
+        await asyncio.sleep(self.save_delay)
+        await self.flush()
+
+    async def flush(self) -> None:
+        """Immediately write any pending save to disk, or wait for the one already being written."""
+        # Holding the lock while writing means a delayed save that's already writing is waited for too
+        async with self._write_lock:
+            if (config_path := self._pending_save_path) is None:
+                return
+            self._pending_save_path = None
+            if self._save_task is not None and self._save_task is not asyncio.current_task():
+                self._save_task.cancel()
+            self._save_task = None
+            try:
+                await self._write(config_path)
+            except Exception as error:
+                self.logger.exception(f"Failed to save config to {config_path}", exc_info=error)
+
+    async def _write(self, config_path: Path) -> None:
+        document = await self._get_document()
+        serialised = await asyncio.to_thread(document.as_yaml)
+        await asyncio.to_thread(_write_atomic, config_path, serialised)
+        if config_path == self._config_path:
+            self._content = serialised  # So watching doesn't treat our own write as an edit
+
+
+def partial_schema(schema: strictyaml.Map) -> strictyaml.Map:
+    """Get a version of a map schema where every key, including those of nested maps, is optional."""
+    # noinspection PyProtectedMember
+    return strictyaml.Map({
+        strictyaml.Optional(key): partial_schema(validator) if isinstance(validator, strictyaml.Map) else validator
+        for key, validator in schema._validator_dict.items()
+    })
+
+
+def _merge(base: dict, override: dict) -> dict:
+    merged = dict(base)
+    for key, value in override.items():
+        merged[key] = _merge(merged[key], value) if isinstance(merged.get(key), dict) else value
+    return merged
+
+
+def _prune(data: dict) -> dict:
+    """Remove empty nested mappings, which strictyaml refuses to serialise."""
+    pruned = {}
+    for key, value in data.items():
+        pruned_value = _prune(value) if isinstance(value, dict) else value
+        if pruned_value != {}:
+            pruned[key] = pruned_value
+    return pruned
+
+
+class GuildConfigOverlay:
+    """Per-guild overrides layered on top of a global :class:`StraponConfig`.
+
+    Each guild's overrides live in their own file, validated against a version of the global schema where every
+    key is optional. Overrides and resolved configs are kept in size limited LRU caches, the latter being
+    invalidated whenever the overrides of a guild or the global config change.
+    """
+
+    def __init__(self, base: StraponConfig, overrides_dir: Path, *, cache_size: int = 1024) -> None:
+        if not isinstance(base.schema, strictyaml.Map):
+            raise TypeError("Guild overrides require a config with a map schema.")
+        self.base = base
+        self.overrides_dir = overrides_dir
+        self.cache_size = cache_size
+        self._schema = partial_schema(base.schema)
+        self._overrides: OrderedDict[int, dict] = OrderedDict()
+        self._resolved: OrderedDict[int, tuple[object, ConfigView | MappingProxyType]] = OrderedDict()
+        self._lock = asyncio.Lock()
+
+    def _override_file(self, guild_id: int) -> Path:
+        return self.overrides_dir / f"{guild_id}.yml"
+
+    def _read_override(self, guild_id: int) -> dict:
+        """Read and validate the overrides of a guild. Blocking, run in an executor."""
+        override_file = self._override_file(guild_id)
+        try:
+            content = override_file.read_text(encoding="utf-8")
+        except FileNotFoundError:
+            return {}
+        if not content.strip():
+            return {}
+        data = strictyaml.load(content, schema=self._schema, label=override_file.as_posix()).data
+        assert isinstance(data, dict), "Config data is not a dict."
+        return data
+
+    def _remember_override(self, guild_id: int, override: dict) -> None:
+        self._overrides[guild_id] = override
+        self._overrides.move_to_end(guild_id)
+        while len(self._overrides) > self.cache_size:
+            self._overrides.popitem(last=False)
+
+    async def _get_override(self, guild_id: int) -> dict:
+        """Get the overrides of a guild. Must be called with the lock held, so a read can't race a write."""
+        if (override := self._overrides.get(guild_id)) is not None:
+            self._overrides.move_to_end(guild_id)
+            return override
+        override = await asyncio.to_thread(self._read_override, guild_id)
+        self._remember_override(guild_id, override)
+        return override
+
+    async def get(self, guild_id: int) -> ConfigView | MappingProxyType:
+        """Get the config of a guild, with its overrides applied on top of the global config."""
+        base_view = self.base.view
+        if base_view is None:
             raise ValueError("No config loaded.")
-        async with aiofiles.open(config_path, "w", encoding="utf-8") as file:
-            await file.write(self._data.as_yaml())
+        # The global config's view is rebuilt on every change, so it doubles as a version marker
+        if (cached := self._resolved.get(guild_id)) is not None and cached[0] is base_view:
+            self._resolved.move_to_end(guild_id)
+            return cached[1]
+
+        async with self._lock:
+            override = await self._get_override(guild_id)
+            # The global config may have changed while the overrides were being read
+            base_view = self.base.view
+            assert base_view is not None and self.base.data is not None
+            merged = _merge(self.base.data, override)
+            # noinspection PyProtectedMember
+            view_type_ = self.base._view_type
+            resolved = view_type_(merged) if view_type_ is not None else _freeze(merged)
+            self._resolved[guild_id] = (base_view, resolved)
+            self._resolved.move_to_end(guild_id)
+            while len(self._resolved) > self.cache_size:
+                self._resolved.popitem(last=False)
+        return resolved
+
+    async def set(self, guild_id: int, key: str, value: Any) -> None:
+        """Override the value of a key for a guild. Nested keys are separated by dots."""
+        *parents, name = key.split(".")
+        async with self._lock:
+            override = copy.deepcopy(await self._get_override(guild_id))
+            target = override
+            for parent in parents:
+                target = target.setdefault(parent, {})
+            target[name] = value
+            await self._store(guild_id, override)
+
+    async def clear(self, guild_id: int, key: str | None = None) -> None:
+        """Remove an override for a guild, or all of them if no key is given."""
+        async with self._lock:
+            override: dict = {}
+            if key is not None:
+                override = copy.deepcopy(await self._get_override(guild_id))
+                *parents, name = key.split(".")
+                target = override
+                for parent in parents:
+                    target = target.get(parent, {})
+                target.pop(name, None)
+            await self._store(guild_id, _prune(override))
+
+    async def _store(self, guild_id: int, override: dict) -> None:
+        override_file = self._override_file(guild_id)
+        if override:
+            # Serialising validates the new overrides, before anything gets written
+            document = await asyncio.to_thread(strictyaml.as_document, override, self._schema)
+            await asyncio.to_thread(override_file.parent.mkdir, parents=True, exist_ok=True)
+            await asyncio.to_thread(_write_atomic, override_file, document.as_yaml())
+            override = document.data
+        else:
+            await asyncio.to_thread(override_file.unlink, missing_ok=True)
+        self._remember_override(guild_id, override)
+        self._resolved.pop(guild_id, None)
+
+    def invalidate(self, guild_id: int | None = None) -> None:
+        """Drop cached overrides and resolved configs, for one guild or all of them.
 
+        Only needed if override files are edited by something other than this class.
+        """
+        if guild_id is None:
+            self._overrides.clear()
+            self._resolved.clear()
+        else:
+            self._overrides.pop(guild_id, None)
+            self._resolved.pop(guild_id, None)
@@ -0,0 +1,120 @@
+import asyncio
+from typing import TYPE_CHECKING, Any
+
+from discord.ext import commands
+
+if TYPE_CHECKING:
+    from harness.bot import HarnessBot
+    from harness.components.strapon import StraponMetadata
+
+__all__ = ["LazyStrapon"]
+
+
+class LazyStrapon:
+    """Stands in for a strapon which hasn't been imported yet.
+
+    Placeholder commands are registered for the ``lazy_commands`` the strapon declares in its pyproject.toml, and
+    the bot hands it every dispatched event so it can watch for the ``lazy_events``. The first time any of them is
+    used, the real strapon is loaded and the triggering command or event is forwarded to it.
+    """
+
+    def __init__(self, bot: "HarnessBot", metadata: "StraponMetadata") -> None:
+        self.bot = bot
+        self.metadata = metadata
+        self.logger = bot.logger
+
+        self._commands = [self._make_command(name) for name in metadata.lazy_commands]
+        self._events = frozenset(metadata.lazy_events)
+        self._listening = False
+        self._forwarding: set[asyncio.Task[None]] = set()
+        self._activation: asyncio.Task[bool] | None = None
+
+    def _make_command(self, name: str) -> commands.Command:
+        async def proxy(ctx: commands.Context) -> None:
+            if not await self.activate():
+                await ctx.send(f"Sorry, {self.metadata.display_name} failed to load.")
+                return
+            # Re-parse the message now that the real command exists
+            await self.bot.invoke(await self.bot.get_context(ctx.message))
+
+        return commands.Command(proxy, name=name, ignore_extra=True, help=f"Loads {self.metadata.display_name}.")
+
+    def forward_event(self, event: str, args: tuple[Any, ...]) -> None:
+        """Called by the bot for every dispatched event, with the name of the listeners it goes to (``on_...``)."""
+        if not self._listening or event not in self._events:
+            return
+        # Whatever is listening right now gets the event directly, even if it's the real strapon loading in the
+        # meantime, so only the rest need it forwarded
+        delivered = tuple(self.bot.extra_events.get(event, ()))
+        task = asyncio.create_task(self._forward_event(event, args, delivered))
+        self._forwarding.add(task)
+        task.add_done_callback(self._forwarding.discard)
+
+    async def _forward_event(self, event: str, args: tuple[Any, ...], delivered: tuple[Any, ...]) -> None:
+        if not await self.activate():
+            return
+        for listener in tuple(self.bot.extra_events.get(event, ())):
+            module = getattr(listener, "__module__", None) or ""
+            if listener in delivered or not (
+                module == self.metadata.import_name or module.startswith(f"{self.metadata.import_name}.")
+            ):
+                continue
+            try:
+                await listener(*args)
+            except Exception as error:
+                self.logger.exception(f"Forwarding {event} to {self.metadata.id!r} failed", exc_info=error)
+
+    def register(self) -> None:
+        """Add the placeholders to the bot.
+
+        :raises commands.CommandRegistrationError: If a command name is already taken. Nothing is left registered.
+        """
+        try:
+            for command in self._commands:
+                self.bot.add_command(command)
+        except commands.CommandRegistrationError:
+            self.unregister()
+            raise
+        self._listening = True
+
+    def _unregister_commands(self) -> None:
+        for command in self._commands:
+            if self.bot.all_commands.get(command.name) is command:
+                self.bot.remove_command(command.name)
+
+    def unregister(self) -> None:
+        self._unregister_commands()
+        self._listening = False
+
+    async def activate(self) -> bool:
+        """Load the real strapon, if not already loaded.
+
+        Concurrent callers share one load attempt. If loading fails the placeholders are put back, so the next
+        use tries again.
+
+        :return: Whether the strapon is loaded.
+        """
+        if self._activation is None or (self._activation.done() and not self._activation.result()):
+            self._activation = asyncio.create_task(self._activate())
+        return await asyncio.shield(self._activation)
+
+    async def _activate(self) -> bool:
+        self.logger.info(f"Activating lazy strapon {self.metadata.id!r}")
+        for dependency in self.metadata.strapon_dependencies:
+            if not await self.bot.wait_for_strapon(dependency):
+                self.logger.error(f"Can't activate {self.metadata.id!r}, dependency {dependency!r} is not available.")
+                return False
+        # The real commands can't be added while the placeholders hold their names. Events keep being watched for
+        # until the real listeners are in place, so none get lost in between
+        self._unregister_commands()
+        try:
+            await self.bot.load_extension(self.metadata.import_name)
+        except Exception as error:
+            self.logger.exception(f"Failed to activate lazy strapon {self.metadata.id!r}", exc_info=error)
+            try:
+                self.register()
+            except commands.CommandRegistrationError as registration_error:
+                self.logger.error(f"Can't restore placeholders of {self.metadata.id!r}: {registration_error}")
+            return False
+        self._listening = False
+        return True
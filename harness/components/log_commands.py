@@ -0,0 +1,57 @@
+import datetime
+import logging
+
+from discord.ext import commands
+
+from harness.logs import BufferedRecord, RingBufferHandler
+
+__all__ = ["LogCommands"]
+
+MESSAGE_LIMIT = 2000
+
+
+class LogQueryFlags(commands.FlagConverter, delimiter=" ", prefix="--"):
+    level: str = "DEBUG"
+    logger: str | None = None
+    strapon: str | None = None
+    limit: commands.Range[int, 1, 500] = 25
+
+
+def _format_record(record: BufferedRecord) -> str:
+    timestamp = datetime.datetime.fromtimestamp(record.created).strftime("%H:%M:%S")
+    line = f"{timestamp} [{logging.getLevelName(record.levelno)}] {record.name}: {record.message}"
+    if record.exception is not None:
+        line += f" ({record.exception})"
+    return line.replace("```", "`\u200b``")  # Don't let messages end the code block
+
+
+class LogCommands(commands.Cog):
+    """Owner-only commands for looking at the logs kept in memory by a :class:`RingBufferHandler`."""
+
+    def __init__(self, log_buffer: RingBufferHandler) -> None:
+        self.log_buffer = log_buffer
+
+    @commands.command(name="logs")
+    @commands.is_owner()
+    async def logs(self, ctx: commands.Context, *, flags: LogQueryFlags) -> None:
+        """Show recent log records, e.g. ``logs --level WARNING --strapon example --limit 10``."""
+        level = logging.getLevelName(flags.level.upper())
+        if not isinstance(level, int):
+            await ctx.send(f"Unknown log level: {flags.level}")
+            return
+
+        records = self.log_buffer.query(level=level, logger=flags.logger, strapon=flags.strapon, limit=flags.limit)
+        if not records:
+            await ctx.send("No matching log records.")
+            return
+
+        # Keep the newest lines which fit in a single message
+        lines: list[str] = []
+        length = len("```\n\n```")
+        for record in reversed(records):
+            line = _format_record(record)[:MESSAGE_LIMIT - length - 1]
+            if length + len(line) + 1 > MESSAGE_LIMIT:
+                break
+            lines.append(line)
+            length += len(line) + 1
+        await ctx.send("```\n" + "\n".join(reversed(lines)) + "\n```")
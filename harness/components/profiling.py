@@ -0,0 +1,74 @@
+import asyncio
+import contextlib
+import datetime
+import json
+import time
+from collections import defaultdict
+from collections.abc import Iterator
+from pathlib import Path
+
+__all__ = ["LoadProfiler"]
+
+PHASES = ("find_spec", "exec_module", "setup", "config", "requirements", "add_cog")
+
+
+class LoadProfiler:
+    """Times each phase of loading strapons, to figure out where startup time goes."""
+
+    def __init__(self) -> None:
+        self.started_at = datetime.datetime.now(datetime.UTC)
+        self._start = time.perf_counter()
+        self.strapon_timings: defaultdict[str, defaultdict[str, float]] = defaultdict(lambda: defaultdict(float))
+        self.global_timings: defaultdict[str, float] = defaultdict(float)
+
+    @contextlib.contextmanager
+    def phase(self, strapon_id: str | None, phase: str) -> Iterator[None]:
+        """Time a block of code, adding the duration to the given phase.
+
+        :param strapon_id: The strapon the phase belongs to, or None for phases covering all strapons.
+        :param phase: Name of the phase.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            if strapon_id is None:
+                self.global_timings[phase] += elapsed
+            else:
+                self.strapon_timings[strapon_id][phase] += elapsed
+
+    def _sorted_strapons(self) -> list[tuple[str, dict[str, float]]]:
+        return sorted(self.strapon_timings.items(), key=lambda item: sum(item[1].values()), reverse=True)
+
+    def summary_table(self) -> str:
+        """Get a table of per-strapon phase timings in milliseconds, slowest strapons first."""
+        header = ("strapon", "total", *PHASES)
+        rows = [header]
+        rows.extend(
+            (strapon_id, f"{sum(timings.values()) * 1000:.1f}", *(f"{timings.get(p, 0) * 1000:.1f}" for p in PHASES))
+            for strapon_id, timings in self._sorted_strapons()
+        )
+        widths = [max(len(row[column]) for row in rows) for column in range(len(header))]
+        lines = [
+            "  ".join(cell.ljust(width) for cell, width in zip(row, widths, strict=True)).rstrip()
+            for row in rows
+        ]
+        lines.extend(f"{phase}: {elapsed * 1000:.1f}ms" for phase, elapsed in self.global_timings.items())
+        lines.append(f"wall time: {(time.perf_counter() - self._start) * 1000:.1f}ms")
+        return "\n".join(lines)
+
+    @staticmethod
+    def _write(report_file: Path, content: str) -> None:
+        report_file.parent.mkdir(parents=True, exist_ok=True)
+        report_file.write_text(content, encoding="utf-8")
+
+    async def write_report(self, report_file: Path) -> None:
+        # Serialised here, as loading more strapons in the meantime would change the timings
+        content = json.dumps({
+            "started_at": self.started_at.isoformat(),
+            "wall_time": time.perf_counter() - self._start,
+            "global": self.global_timings,
+            "strapons": dict(self._sorted_strapons()),
+        }, indent=4)
+        await asyncio.to_thread(self._write, report_file, content)
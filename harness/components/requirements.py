@@ -0,0 +1,174 @@
+import asyncio
+import hashlib
+import importlib
+import importlib.metadata
+import json
+import logging
+import shutil
+import site
+import subprocess
+import sys
+from collections.abc import Callable, Iterable
+from pathlib import Path
+
+from packaging.requirements import Requirement
+from packaging.utils import canonicalize_name
+
+__all__ = [
+    "RequirementCache",
+    "find_unsatisfied",
+    "install_requirements",
+    "installed_versions",
+    "invalidate_installed_versions",
+]
+
+_installed_versions: dict[str, str] | None = None
+
+
+def installed_versions() -> dict[str, str]:
+    """Get a mapping of normalised distribution names to their installed versions.
+
+    The mapping is built once and shared until :func:`invalidate_installed_versions` is called.
+    """
+    global _installed_versions  # noqa: PLW0603
+    if _installed_versions is None:
+        versions: dict[str, str] = {}
+        for distribution in importlib.metadata.distributions():
+            if (name := distribution.metadata["Name"]) is None:
+                continue
+            # Earlier entries on sys.path shadow later ones, same as importlib.metadata.version()
+            versions.setdefault(canonicalize_name(name), distribution.version)
+        _installed_versions = versions
+    return _installed_versions
+
+
+def invalidate_installed_versions() -> None:
+    """Discard the installed distribution index, so it gets rebuilt on next use."""
+    global _installed_versions  # noqa: PLW0603
+    _installed_versions = None
+
+
+def find_unsatisfied(requirements: Iterable[Requirement]) -> tuple[Requirement, ...]:
+    """Find the requirements which are not satisfied by the currently installed distributions.
+
+    Duplicate requirements are only returned once, and requirements whose markers don't apply to this environment
+    are ignored.
+    """
+    versions = installed_versions()
+
+    def is_unsatisfied(requirement: Requirement) -> bool:
+        if requirement.marker is not None and not requirement.marker.evaluate():
+            return False
+        version = versions.get(canonicalize_name(requirement.name))
+        return version is None or version not in requirement.specifier
+
+    unique = {str(requirement): requirement for requirement in requirements}
+    return tuple(filter(is_unsatisfied, unique.values()))
+
+
+async def install_requirements(requirements: Iterable[Requirement], logger: logging.Logger) -> None:
+    """Install requirements in a single installer run, using uv if available and pip otherwise.
+
+    :raises subprocess.CalledProcessError: If the installer exits with a non-zero exit code.
+    """
+    requirements = tuple(requirements)
+    logger.info("Installing missing requirements: " + ", ".join(map(str, requirements)))
+    logger.debug(f"Using {'uv' if shutil.which('uv') else 'pip'} to install requirements")
+    if shutil.which("uv"):
+        cmd = ["uv", "pip", "install", "--python", sys.executable, *map(str, requirements)]
+    else:
+        cmd = [sys.executable, "-m", "pip", "install", *map(str, requirements)]
+
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    assert process.stdout is not None and process.stderr is not None
+
+    async def log_stream(stream: asyncio.StreamReader, logger_func: Callable[[str], None]) -> None:
+        while line := (await stream.readline()).decode().rstrip():
+            logger_func(line)
+
+    await asyncio.gather(
+        log_stream(process.stdout, logger.info),
+        log_stream(process.stderr, logger.error),
+    )
+    return_code = await process.wait()
+    if return_code != 0:
+        invalidate_installed_versions()  # A failed install can still have installed some of the requirements
+        logger.error(f"Failed to install requirements with exit code {return_code}")
+        raise subprocess.CalledProcessError(return_code, cmd)
+    importlib.invalidate_caches()
+    invalidate_installed_versions()
+
+
+def site_packages_snapshot() -> dict[str, int | None]:
+    """Get the mtimes of every site-packages directory distributions could be installed into."""
+    paths = {*site.getsitepackages(), site.getusersitepackages()}
+    paths.update(path for path in sys.path if Path(path).name in {"site-packages", "dist-packages"})
+    snapshot: dict[str, int | None] = {}
+    for path in sorted(paths):
+        try:
+            snapshot[path] = Path(path).stat().st_mtime_ns
+        except OSError:
+            snapshot[path] = None
+    return snapshot
+
+
+class RequirementCache:
+    """Remembers which strapons had all their requirements satisfied, so warm starts can skip checking them.
+
+    Entries are fingerprinted by the strapon's requirement set and are all invalidated as soon as any
+    site-packages directory changes.
+    """
+
+    def __init__(self, cache_file: Path) -> None:
+        self.cache_file = cache_file
+        self._site_packages: dict[str, int | None] | None = None
+        self._satisfied: dict[str, str] | None = None
+
+    @staticmethod
+    def fingerprint(requirements: Iterable[Requirement]) -> str:
+        return hashlib.sha256("\n".join(sorted(map(str, requirements))).encode()).hexdigest()
+
+    def _load(self) -> dict[str, str]:
+        """Read the cache file if it hasn't been yet. Blocking, use :meth:`load` on the event loop."""
+        if self._satisfied is None:
+            try:
+                data = json.loads(self.cache_file.read_text(encoding="utf-8"))
+                site_packages, satisfied = data["site_packages"], data["satisfied"]
+            except (OSError, ValueError, KeyError, TypeError):
+                site_packages, satisfied = None, {}
+            self._site_packages = site_packages
+            # Anything installed or removed since the cache was written could have broken any of the entries
+            self._satisfied = satisfied if site_packages == site_packages_snapshot() else {}
+        return self._satisfied
+
+    async def load(self) -> None:
+        """Read the cache file in a thread, so :meth:`is_satisfied` and :meth:`mark_satisfied` don't block."""
+        if self._satisfied is None:
+            await asyncio.to_thread(self._load)
+
+    def is_satisfied(self, strapon_id: str, requirements: Iterable[Requirement]) -> bool:
+        return self._load().get(strapon_id) == self.fingerprint(requirements)
+
+    def mark_satisfied(self, strapon_id: str, requirements: Iterable[Requirement]) -> None:
+        self._load()[strapon_id] = self.fingerprint(requirements)
+
+    def invalidate(self) -> None:
+        """Forget every entry, to be used when the installed distributions are known to have changed."""
+        self._satisfied = {}
+
+    def _write(self, satisfied: dict[str, str]) -> None:
+        self._site_packages = site_packages_snapshot()
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_file.write_text(
+            json.dumps({"site_packages": self._site_packages, "satisfied": satisfied}),
+            encoding="utf-8",
+        )
+
+    async def save(self) -> None:
+        await self.load()
+        # Copied, as the entries may change while the file is being written
+        await asyncio.to_thread(self._write, dict(self._load()))
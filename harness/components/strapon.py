@@ -1,24 +1,24 @@
 import asyncio
-import importlib.metadata
+import hashlib
+import json
 import os
 import re
 import shutil
-import subprocess
-import sys
 import tomllib
-from collections.abc import Callable
 from pathlib import Path
-from typing import TYPE_CHECKING
+from typing import TYPE_CHECKING, Any
 
+import strictyaml
 from discord.ext import commands
 from packaging.requirements import Requirement
 
-from harness.components.config import DEFAULT_CONFIG_FILE_NAME, StraponConfig
+from harness.components.config import DEFAULT_CONFIG_FILE_NAME, GuildConfigOverlay, StraponConfig
+from harness.components.requirements import find_unsatisfied, install_requirements
 
 if TYPE_CHECKING:
     from harness.bot import HarnessBot
 
-__all__ = ["Strapon", "StraponCog", "StraponMetadata", "RequirementInstallSuccessError"]
+__all__ = ["Strapon", "StraponCog", "StraponMetadata", "StraponMetadataCache", "RequirementInstallSuccessError"]
 
 
 def importable_normalise(name: str) -> str:
@@ -31,31 +31,111 @@ def importable_normalise(name: str) -> str:
 
 
 class StraponMetadata:
-    def __init__(self, package_dir: Path) -> None:
+    def __init__(self, package_dir: Path, project: dict[str, Any] | None = None) -> None:
+        """Metadata for a strapon package.
+
+        :param package_dir: The directory of the strapon package.
+        :param project: The already parsed ``[project]`` table. If not given, pyproject.toml is read from disk.
+        """
         self.display_name: str
         self.id: str
         self.requirements: list[Requirement]
+        self.lazy_commands: list[str]
+        self.lazy_events: list[str]
+        self.strapon_dependencies: list[str]
         self.import_name: str = package_dir.relative_to(Path().resolve()).as_posix().replace("/", ".")
 
-        pyproject_file = package_dir / "pyproject.toml"
-        if not pyproject_file.is_file():
-            raise FileNotFoundError(f"Strapon project file not found at: {pyproject_file.resolve()}")
-        with open(pyproject_file) as file:  # File read in init is... not great but maybe fine?
-            pyproject = tomllib.loads(file.read())
+        if project is None:
+            pyproject_file = package_dir / "pyproject.toml"
+            if not pyproject_file.is_file():
+                raise FileNotFoundError(f"Strapon project file not found at: {pyproject_file.resolve()}")
+            with open(pyproject_file, "rb") as file:
+                project = tomllib.load(file).get("project", {})
+        self.project = project
 
-        if "project" not in pyproject or "name" not in pyproject["project"]:
+        if "name" not in project:
             raise ValueError("Invalid pyproject.toml file. Missing project name.")
-        self.display_name = pyproject["project"]["name"]
+        self.display_name = project["name"]
 
-        if "project" not in pyproject or "id" not in pyproject["project"]:
+        if "id" not in project:
             raise ValueError("Invalid pyproject.toml file. Missing project id.")
-        self.id = pyproject["project"]["id"]
+        self.id = project["id"]
         if self.id != importable_normalise(self.id):
             raise ValueError("Project ID must be importable.")
         if self.id != package_dir.name:
             raise ValueError("Project ID must match package name.")
 
-        self.requirements = list(map(Requirement, pyproject["project"].get("dependencies", [])))
+        self.requirements = list(map(Requirement, project.get("dependencies", [])))
+        self.lazy_commands = list(project.get("lazy_commands", []))
+        self.lazy_events = list(project.get("lazy_events", []))
+        self.strapon_dependencies = list(project.get("strapon_dependencies", []))
+
+
+class StraponMetadataCache:
+    """Caches parsed strapon metadata, both in memory and on disk.
+
+    Entries are keyed by package directory and are only re-parsed once the mtime of their pyproject.toml changes.
+    If only the mtime changed but the content hash didn't, the cached entry is kept.
+    """
+
+    def __init__(self, cache_file: Path) -> None:
+        self.cache_file = cache_file
+        self._disk_entries: dict[str, dict[str, Any]] | None = None
+        self._loaded: dict[Path, tuple[int, StraponMetadata]] = {}
+        self._dirty = False
+
+    def _read_disk_entries(self) -> dict[str, dict[str, Any]]:
+        if self._disk_entries is None:
+            try:
+                self._disk_entries = json.loads(self.cache_file.read_text(encoding="utf-8"))
+            except (OSError, ValueError):
+                self._disk_entries = {}
+        return self._disk_entries
+
+    def get(self, package_dir: Path, *, check_mtime: bool = True) -> StraponMetadata:
+        """Get the metadata for a strapon package, parsing its pyproject.toml only if it changed.
+
+        :param package_dir: The directory of the strapon package.
+        :param check_mtime: Whether to check if an already loaded entry is outdated. If False, this does no IO for
+            packages which were already loaded in this process.
+        """
+        package_dir = package_dir.resolve()
+        if not check_mtime and (loaded := self._loaded.get(package_dir)) is not None:
+            return loaded[1]
+        pyproject_file = package_dir / "pyproject.toml"
+        try:
+            mtime = pyproject_file.stat().st_mtime_ns
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Strapon project file not found at: {pyproject_file}") from None
+
+        if (loaded := self._loaded.get(package_dir)) is not None and loaded[0] == mtime:
+            return loaded[1]
+
+        entries = self._read_disk_entries()
+        entry = entries.get(str(package_dir))
+        if entry is not None and entry["mtime"] == mtime:
+            metadata = StraponMetadata(package_dir, entry["project"])
+        else:
+            raw = pyproject_file.read_bytes()
+            digest = hashlib.sha256(raw).hexdigest()
+            if entry is not None and entry["hash"] == digest:
+                project = entry["project"]
+            else:
+                project = tomllib.loads(raw.decode()).get("project", {})
+            metadata = StraponMetadata(package_dir, project)
+            entries[str(package_dir)] = {"mtime": mtime, "hash": digest, "project": project}
+            self._dirty = True
+
+        self._loaded[package_dir] = (mtime, metadata)
+        return metadata
+
+    def save(self) -> None:
+        """Write the cache to disk if anything changed since it was last read."""
+        if not self._dirty or self._disk_entries is None:
+            return
+        self.cache_file.parent.mkdir(parents=True, exist_ok=True)
+        self.cache_file.write_text(json.dumps(self._disk_entries, default=str), encoding="utf-8")
+        self._dirty = False
 
 
 class RequirementInstallSuccessError(Exception):
@@ -74,7 +154,8 @@ class Strapon:
         self.bot = bot
         self.package_dir = Path(path)
         self.logger = self.bot.logger.getChild(self.package_dir.name)
-        self.metadata = StraponMetadata(self.package_dir)
+        # Discovery or reloading has already made sure the metadata is up to date
+        self.metadata = self.bot.strapon_metadata.get(self.package_dir, check_mtime=False)
 
         self._storage_path = self.bot.data_dir / "storage" / self.metadata.id
 
@@ -83,88 +164,92 @@ class Strapon:
 
         self.config = config
         self.default_config_file: Path | None = None
+        self.guild_config: GuildConfigOverlay | None = None
 
         if self.config is not None:
             self.config._config_path = config_path
             self.default_config_file = default_config_path
-            if not default_config_path.is_file():
-                raise FileNotFoundError(
-                    f"A default config file is required if a config object is provided. "
-                    f"File not found at: {default_config_path.resolve()}",
-                )
+            if not self.config.save_delay and self.bot.bot_config.data is not None:
+                self.config.save_delay = self.bot.bot_config.data.get("config_save_delay", 0)
+            if isinstance(self.config.schema, strictyaml.Map):
+                self.guild_config = GuildConfigOverlay(self.config, config_path.with_suffix(""))
 
     @property
     def storage_path(self) -> Path:
-        self.storage_path.mkdir(parents=True, exist_ok=True)
+        self._storage_path.mkdir(parents=True, exist_ok=True)
         return self._storage_path
 
+    def _bootstrap_config_file(self) -> None:
+        """Copy the default config into place if there is no config yet. Blocking, run in an executor."""
+        # noinspection PyProtectedMember
+        config_path = self.config._config_path if self.config is not None else None
+        assert config_path is not None, "Invalid config object. How did we get here?"
+        assert self.default_config_file is not None, "Strapon has config but no default config file."
+        if not self.default_config_file.is_file():
+            raise FileNotFoundError(
+                f"A default config file is required if a config object is provided. "
+                f"File not found at: {self.default_config_file.resolve()}",
+            )
+        if not config_path.is_file():
+            config_path.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(self.default_config_file, config_path)
+
     async def load(self) -> None:
+        await self.prepare()
+        with self.bot.load_profiler.phase(self.metadata.id, "add_cog"):
+            for cog in self._cogs:
+                await self.bot.add_cog(cog)
+        self.watch_config()
+
+    def watch_config(self) -> None:
+        """Start reloading the strapon's config whenever it changes, if enabled in the bot config."""
+        bot_config = self.bot.bot_config.data
+        if self.config is not None and bot_config is not None and bot_config.get("live_config_reload", False):
+            self.config.watch()
+
+    async def unload(self) -> None:
+        """Clean up after the strapon, once its cogs have been removed."""
+        if self.config is not None:
+            self.config.stop_watching()
+            await self.config.flush()
+
+    async def prepare(self) -> None:
+        """Load config and install requirements, everything needed before the strapon's cogs can be added."""
         if self.config is not None:
             # noinspection PyProtectedMember
             config_path = self.config._config_path
             assert config_path is not None, "Invalid config object. How did we get here?"
-            assert self.default_config_file is not None, "Strapon has config but no default config file."
-            if not config_path.is_file():
-                config_path.parent.mkdir(parents=True, exist_ok=True)
-                shutil.copy(self.default_config_file, config_path)
+            await asyncio.to_thread(self._bootstrap_config_file)
             try:
-                await self.config.load(config_path)
+                with self.bot.load_profiler.phase(self.metadata.id, "config"):
+                    await self.config.load(config_path, self.bot.config_snapshots)
             except Exception as error:
                 raise ValueError(f"Failed to load config for strapon {self.metadata.id}") from error
 
         # We do this after the other far cheaper operations
-        installed_new = await self.install_requirements()
+        with self.bot.load_profiler.phase(self.metadata.id, "requirements"):
+            installed_new = await self.install_requirements()
         if installed_new:
             raise RequirementInstallSuccessError("New requirements were installed. Strapon reload required.")
 
-        for cog in self._cogs:
-            await self.bot.add_cog(cog)
-
     def register_cog(self, cog: commands.Cog) -> None:
         self._cogs.add(cog)
 
-    async def install_requirements(self) -> bool:
-        installed_distributions = tuple(importlib.metadata.distributions())
-
-        def is_unsatisfied(requirement: Requirement) -> bool:
-            for installed in installed_distributions:
-                if requirement.name != installed.name:
-                    continue
-                if importlib.metadata.version(requirement.name) in requirement.specifier:
-                    return False
-            return True
+    @property
+    def cogs(self) -> frozenset[commands.Cog]:
+        return frozenset(self._cogs)
 
-        if not (missing_requirements := tuple(filter(is_unsatisfied, self.metadata.requirements))):
+    async def install_requirements(self) -> bool:
+        cache = self.bot.requirement_cache
+        await cache.load()
+        if cache.is_satisfied(self.metadata.id, self.metadata.requirements):
             return False
-        self.logger.info(
-            "Installing missing requirements: "
-            + ", ".join(f'"{req.name}' for req in missing_requirements),
-        )
-        self.logger.debug(f"Using {'uv' if shutil.which('uv') else 'pip'} to install requirements")
-        if shutil.which("uv"):
-            cmd = ["uv", "pip", "install", "--python", sys.executable, *map(str, missing_requirements)]
-        else:
-            cmd = [sys.executable, "-m", "pip", "install", *map(str, missing_requirements)]
-
-        process = await asyncio.create_subprocess_exec(
-            *cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-        )
-        assert process.stdout is not None and process.stderr is not None
-
-        async def log_stream(stream: asyncio.StreamReader, logger_func: Callable[[str], None]) -> None:
-            while line := (await stream.readline()).decode().rstrip():
-                logger_func(line)
-
-        await asyncio.gather(
-            log_stream(process.stdout, self.logger.info),
-            log_stream(process.stderr, self.logger.error),
-        )
-        return_code = await process.wait()
-        if return_code != 0:
-            self.logger.error(f"Failed to install requirements with exit code {return_code}")
-            raise subprocess.CalledProcessError(return_code, cmd)
+        if not (missing_requirements := await asyncio.to_thread(find_unsatisfied, self.metadata.requirements)):
+            cache.mark_satisfied(self.metadata.id, self.metadata.requirements)
+            await cache.save()
+            return False
+        await install_requirements(missing_requirements, self.logger)
+        cache.invalidate()
         return True
 
 
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import time
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from harness.bot import HarnessBot
+
+__all__ = ["StraponWatcher"]
+
+_Signature = tuple[tuple[str, int, int], ...]
+
+
+def _package_signature(package_dir: str) -> _Signature:
+    entries: list[tuple[str, int, int]] = []
+    to_scan = [package_dir]
+    while to_scan:
+        with os.scandir(to_scan.pop()) as directory:
+            for entry in directory:
+                if entry.is_dir():
+                    if entry.name != "__pycache__":
+                        to_scan.append(entry.path)
+                    continue
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((entry.path, stat.st_mtime_ns, stat.st_size))
+    return tuple(sorted(entries))
+
+
+class StraponWatcher:
+    """Polls the strapon and config directories, reloading strapons whose files changed.
+
+    Changes are debounced, so a burst of writes (like a git pull) only causes a single reload once things settle.
+    """
+
+    def __init__(self, bot: "HarnessBot", *, interval: float = 1, debounce: float = 1) -> None:
+        self.bot = bot
+        self.interval = interval
+        self.debounce = debounce
+        self._task: asyncio.Task[None] | None = None
+
+    def _snapshot(self) -> dict[str, tuple[_Signature, _Signature]]:
+        """Map strapon ids to signatures of their package and of their config file. Blocking, run in an executor."""
+        packages: dict[str, _Signature] = {}
+        with os.scandir(self.bot.strapons_dir) as entries:
+            for entry in entries:
+                if entry.is_dir():
+                    packages[entry.name] = _package_signature(entry.path)
+        configs: dict[str, _Signature] = {}
+        config_dir = self.bot.data_dir / "config"
+        bot_config = self.bot.bot_config.data or {}
+        # Live reloading applies config changes without reloading the whole strapon
+        if not bot_config.get("live_config_reload", False) and config_dir.is_dir():
+            with os.scandir(config_dir) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".yml") and entry.is_file():
+                        stat = entry.stat()
+                        configs[entry.name.removesuffix(".yml")] = ((entry.path, stat.st_mtime_ns, stat.st_size),)
+        return {
+            strapon_id: (packages.get(strapon_id, ()), configs.get(strapon_id, ()))
+            for strapon_id in packages.keys() | configs.keys()
+        }
+
+    async def _only_saved_by_strapon(self, strapon_id: str) -> bool:
+        """Whether a strapon's config file only changed because the strapon itself saved it."""
+        strapon = self.bot.get_strapon(strapon_id)
+        if strapon is None or strapon.config is None:
+            return False
+        try:
+            return not await strapon.config.changed_on_disk()
+        except (OSError, ValueError):
+            return False
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run(), name="harness: strapon watcher")
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        previous = await asyncio.to_thread(self._snapshot)
+        # Strapon ids mapped to whether their package changed, as opposed to only their config
+        pending: dict[str, bool] = {}
+        last_change = 0.0
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                current = await asyncio.to_thread(self._snapshot)
+            except OSError as error:
+                self.bot.logger.warning(f"Failed to scan strapons for changes: {error}")
+                continue
+            changed = {
+                strapon_id: previous.get(strapon_id, ((), ()))[0] != current.get(strapon_id, ((), ()))[0]
+                for strapon_id in previous.keys() | current.keys()
+                if previous.get(strapon_id) != current.get(strapon_id)
+            }
+            previous = current
+            if changed:
+                for strapon_id, package_changed in changed.items():
+                    pending[strapon_id] = pending.get(strapon_id, False) or package_changed
+                last_change = time.monotonic()
+                continue
+            if not pending or time.monotonic() - last_change < self.debounce:
+                continue
+
+            for strapon_id, package_changed in sorted(pending.items()):
+                if not self.bot.is_strapon_watched(strapon_id):
+                    continue
+                if not package_changed and await self._only_saved_by_strapon(strapon_id):
+                    continue
+                self.bot.logger.info(f"Detected changes in strapon {strapon_id!r}, reloading.")
+                try:
+                    await self.bot.reload_strapon(strapon_id)
+                except Exception as error:
+                    self.bot.logger.exception(f"Failed to reload strapon {strapon_id!r}", exc_info=error)
+            pending.clear()
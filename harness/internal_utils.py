@@ -1,14 +1,27 @@
 import logging
 import re
 
+# Record attributes whose values can change the width of a log prefix, besides the logger name and level
+_VARIABLE_WIDTH_FIELDS = re.compile(
+    r"(pathname|filename|module|funcName|lineno|process|processName|thread|threadName|taskName|relativeCreated)",
+)
+
 
 class IndentFormatter(logging.Formatter):
     def __init__(self, to_wrap: logging.Formatter | None = None) -> None:
         super().__init__()
         self._wrapped = to_wrap or logging.Formatter()
+        self._prefix_lengths: dict[tuple[str, int], int] = {}
 
-    def get_prefix_length(self, record: logging.LogRecord) -> int:
-        """Get the length of the prefix of the log message. Will not give wanted results if ANSI is involved."""
+        # Formatters which override format() (like discord.py's colour formatter) can't be inspected, so those are
+        # assumed to depend on the logger name and level only
+        fmt = getattr(self._wrapped, "_fmt", None) or ""
+        self._cacheable = not _VARIABLE_WIDTH_FIELDS.search(fmt)
+        self._depends_on_record = type(self._wrapped).format is not logging.Formatter.format or any(
+            field in fmt for field in ("name", "levelname", "levelno")
+        )
+
+    def _compute_prefix_length(self, record: logging.LogRecord) -> int:
         formatted = self._wrapped.format(logging.LogRecord(
             name=record.name,
             level=record.levelno,
@@ -22,7 +35,22 @@ class IndentFormatter(logging.Formatter):
         formatted = re.sub(r"\x1b\[[0-9;]*m", "", formatted)  # Simple filter for ANSI escape codes
         return len(formatted)
 
+    def get_prefix_length(self, record: logging.LogRecord) -> int:
+        """Get the length of the prefix of the log message. Will not give wanted results if ANSI is involved.
+
+        The length is cached per logger name and level, or just once if the format doesn't depend on either.
+        """
+        if not self._cacheable:
+            return self._compute_prefix_length(record)
+        key = (record.name, record.levelno) if self._depends_on_record else ("", 0)
+        if (length := self._prefix_lengths.get(key)) is None:
+            length = self._prefix_lengths[key] = self._compute_prefix_length(record)
+        return length
+
     def format(self, record: logging.LogRecord) -> str:
+        formatted = self._wrapped.format(record)
+        if "\n" not in formatted and "\r" not in formatted:
+            return formatted
         indent = " " * self.get_prefix_length(record)
-        initial, *rest = self._wrapped.format(record).splitlines(keepends=True)
+        initial, *rest = formatted.splitlines(keepends=True)
         return initial + "".join(indent + line for line in rest)
@@ -0,0 +1,571 @@
+import atexit
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
+import copy
+import datetime
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from collections.abc import Callable, Iterator
+from pathlib import Path
+from typing import Any
+
+__all__ = [
+    "LOG_CONTEXT",
+    "BufferedRecord",
+    "JsonFormatter",
+    "JsonLogHandler",
+    "QueuedLogging",
+    "RateLimitFilter",
+    "RingBufferHandler",
+    "RotatingLogHandler",
+    "capture_log_context",
+    "log_context",
+]
+
+_log = logging.getLogger(__name__)
+
+LOG_DATE_FORMAT = "%Y-%m-%d"
+
+# Extra fields (guild, command, ...) attached to records logged while handling something
+LOG_CONTEXT: contextvars.ContextVar[dict[str, Any] | None] = contextvars.ContextVar("harness_log_context", default=None)
+
+
+class _DeferredQueueHandler(logging.handlers.QueueHandler):
+    """A queue handler which leaves formatting to the handlers on the other end of the queue.
+
+    Only the message arguments get merged here, as they may change after the record is queued. Exception info is
+    passed along as is.
+    """
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+
+class QueuedLogging:
+    """Moves the handlers of a logger behind a queue, so a listener thread does their formatting and IO."""
+
+    def __init__(self, logger: logging.Logger | None = None) -> None:
+        self.logger = logger or logging.getLogger()
+        self._handlers: list[logging.Handler] = []
+        self._queue_handler: logging.handlers.QueueHandler | None = None
+        self._listener: logging.handlers.QueueListener | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._listener is not None
+
+    def start(self) -> None:
+        if self._listener is not None:
+            return
+        self._handlers = list(self.logger.handlers)
+        log_queue: queue.SimpleQueue[logging.LogRecord] = queue.SimpleQueue()
+        self._queue_handler = _DeferredQueueHandler(log_queue)
+        self._listener = logging.handlers.QueueListener(log_queue, *self._handlers, respect_handler_level=True)
+        self._listener.start()
+        for handler in self._handlers:
+            self.logger.removeHandler(handler)
+        self.logger.addHandler(self._queue_handler)
+        atexit.register(self.stop)  # The listener thread is a daemon, so don't lose what's queued on a crash
+
+    def stop(self) -> None:
+        """Write out everything still queued and attach the handlers directly again."""
+        if self._listener is None or self._queue_handler is None:
+            return
+        atexit.unregister(self.stop)
+        self.logger.removeHandler(self._queue_handler)
+        for handler in self._handlers:
+            self.logger.addHandler(handler)
+        self._listener.stop()  # Processes the rest of the queue before returning
+        self._listener = None
+        self._queue_handler = None
+
+
+def _strapon_of_logger(logger_name: str, strapon_logger_prefix: str) -> str | None:
+    """Get the strapon a logger belongs to, given the name of the parent of all strapon loggers plus a dot."""
+    if not logger_name.startswith(strapon_logger_prefix):
+        return None
+    return logger_name[len(strapon_logger_prefix):].partition(".")[0]
+
+
+def _next_midnight(date: datetime.date) -> float:
+    return datetime.datetime.combine(date + datetime.timedelta(days=1), datetime.time.min).timestamp()
+
+
+class RotatingLogHandler(logging.FileHandler):
+    """Writes to ``latest.log``, moving it to ``<date>.<number>.log`` on startup, once it grows too large, and when
+    the day changes. The ``.log`` suffix can be changed.
+
+    Renaming happens inline, as it's cheap and has to happen between two writes. Compressing rotated files and
+    deleting those past the retention limit is left to a worker thread. The next number for each date is kept in an
+    index built from a single scan of the logs directory, instead of probing for a free file name.
+    """
+
+    def __init__(
+        self,
+        logs_dir: Path,
+        *,
+        suffix: str = ".log",
+        max_bytes: int = 0,
+        rotate_daily: bool = False,
+        retention: int = 0,
+        compress: bool = False,
+    ) -> None:
+        """
+        :param logs_dir: Directory to write logs to.
+        :param suffix: Suffix of the log files.
+        :param max_bytes: Rotate once the log reaches roughly this size. 0 disables rotating by size.
+        :param rotate_daily: Rotate when the first record of a new day comes in.
+        :param retention: Number of rotated logs to keep. 0 keeps all of them.
+        :param compress: Gzip rotated logs.
+        """
+        self.logs_dir = logs_dir
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.rotate_daily = rotate_daily
+        self.retention = retention
+        self.compress = compress
+        self._worker = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="harness-log-rotation")
+
+        # Only touched by the worker after this, so it doesn't need locking
+        self._archives: collections.deque[Path] = collections.deque()
+        self._archive_numbers: dict[str, int] = {}
+        self._archive_name = re.compile(rf"^(?P<date>.+)\.(?P<number>\d+){re.escape(suffix)}(?:\.gz)?$")
+        self._index_archives()
+
+        latest_log_file = logs_dir / f"latest{suffix}"
+        if latest_log_file.is_file():
+            self._archive_file(latest_log_file, self._read_log_date(latest_log_file))
+        super().__init__(latest_log_file, "w", encoding="utf-8")
+        self._start_file()
+
+    def _index_archives(self) -> None:
+        found: list[tuple[str, int, Path]] = []
+        with os.scandir(self.logs_dir) as entries:
+            for entry in entries:
+                if (match := self._archive_name.match(entry.name)) is None:
+                    continue
+                date_str, number = match["date"], int(match["number"])
+                self._archive_numbers[date_str] = max(number, self._archive_numbers.get(date_str, 0))
+                found.append((date_str, number, self.logs_dir / f"{date_str}.{number}{self.suffix}"))
+        # A log and its compressed version (from an interrupted compression) are the same archive
+        self._archives.extend(dict.fromkeys(path for _, _, path in sorted(found)))
+
+    def _read_log_date(self, log_file: Path) -> str:
+        """Get the date a log file was started on, from its first timestamp."""
+        timestamp_length = len(datetime.date.today().strftime(LOG_DATE_FORMAT))
+        with log_file.open(encoding="utf-8") as file:
+            date_str = file.read(timestamp_length)
+        try:
+            datetime.datetime.strptime(date_str, LOG_DATE_FORMAT).date()
+        except ValueError:
+            _log.warning(f"Invalid timestamp in log file: {date_str}")
+            return "INVALID"
+        return date_str
+
+    def _start_file(self) -> None:
+        self._size = 0
+        self._date = datetime.date.today()
+        self._rollover_at = _next_midnight(self._date)
+
+    def _archive_file(self, log_file: Path, date_str: str) -> None:
+        number = self._archive_numbers[date_str] = self._archive_numbers.get(date_str, 0) + 1
+        archive_path = log_file.rename(self.logs_dir / f"{date_str}.{number}{self.suffix}")
+        self._worker.submit(self._process_archive, archive_path)
+
+    def configure(self, *, max_bytes: int, rotate_daily: bool, retention: int, compress: bool) -> None:
+        """Change the rotation options, applying the retention limit and compression to existing logs."""
+        with self.lock:  # pyright: ignore [reportOptionalContextManager]
+            self.max_bytes = max_bytes
+            self.rotate_daily = rotate_daily
+            self.retention = retention
+            self.compress = compress
+        self._worker.submit(self._apply_to_archives)
+
+    def should_rollover(self, record: logging.LogRecord, message: str) -> bool:
+        if self.rotate_daily and record.created >= self._rollover_at:
+            return True
+        # Counted in characters instead of bytes, which is close enough for a size limit
+        return bool(self.max_bytes) and self._size > 0 and self._size + len(message) > self.max_bytes
+
+    def rollover(self) -> None:
+        with self.lock:  # pyright: ignore [reportOptionalContextManager]
+            if self.stream is not None:
+                self.stream.close()
+                self.stream = None  # pyright: ignore [reportAttributeAccessIssue]
+            log_file = Path(self.baseFilename)
+            if log_file.is_file():
+                self._archive_file(log_file, self._date.strftime(LOG_DATE_FORMAT))
+            self._start_file()
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            message = self.format(record) + self.terminator
+            if self.should_rollover(record, message):
+                self.rollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(message)
+            self.flush()
+            self._size += len(message)
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _compress(self, archive_path: Path) -> None:
+        if not archive_path.is_file():  # Already compressed
+            return
+        compressed_path = archive_path.with_name(f"{archive_path.name}.gz")
+        partial_path = compressed_path.with_name(f"{compressed_path.name}.tmp")
+        try:
+            with archive_path.open("rb") as source, gzip.open(partial_path, "wb") as target:
+                shutil.copyfileobj(source, target)
+            partial_path.replace(compressed_path)
+            archive_path.unlink()
+        except OSError as error:
+            _log.warning(f"Failed to compress log {archive_path.name}: {error}")
+            partial_path.unlink(missing_ok=True)
+
+    def _process_archive(self, archive_path: Path) -> None:
+        """Compress a rotated log and enforce the retention limit. Runs in the worker thread."""
+        if self.compress:
+            self._compress(archive_path)
+        self._archives.append(archive_path)
+        self._prune()
+
+    def _apply_to_archives(self) -> None:
+        """Enforce the retention limit and compression on every rotated log, including ones rotated before the
+        options were set. Runs in the worker thread.
+        """
+        self._prune()
+        if self.compress:
+            for archive_path in tuple(self._archives):
+                self._compress(archive_path)
+
+    def _prune(self) -> None:
+        while self.retention and len(self._archives) > self.retention:
+            archive_path = self._archives.popleft()
+            try:
+                archive_path.unlink(missing_ok=True)
+                archive_path.with_name(f"{archive_path.name}.gz").unlink(missing_ok=True)
+            except OSError as error:
+                _log.warning(f"Failed to delete old log {archive_path.name}: {error}")
+
+    def close(self) -> None:
+        super().close()
+        self._worker.shutdown(wait=True)  # Let pending compression finish
+
+
+@contextlib.contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """Attach extra fields to records logged within the block, including from tasks it starts."""
+    token = LOG_CONTEXT.set({**(LOG_CONTEXT.get() or {}), **fields})
+    try:
+        yield
+    finally:
+        LOG_CONTEXT.reset(token)
+
+
+def capture_log_context() -> Callable[[], None]:
+    """Make new log records carry the current :data:`LOG_CONTEXT`, as ``record.harness_context``.
+
+    This has to happen when the record is created, as handlers may run in another thread. Returns a function
+    restoring the previous record factory.
+    """
+    previous_factory = logging.getLogRecordFactory()
+
+    def factory(*args: Any, **kwargs: Any) -> logging.LogRecord:
+        record = previous_factory(*args, **kwargs)
+        record.harness_context = LOG_CONTEXT.get()
+        return record
+
+    logging.setLogRecordFactory(factory)
+    return lambda: logging.setLogRecordFactory(previous_factory)
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats records as a single line JSON object, for log shippers.
+
+    Strapon loggers (children of ``strapon_logger_prefix``) get their strapon id included.
+    """
+
+    def __init__(self, strapon_logger_prefix: str) -> None:
+        super().__init__()
+        self.strapon_logger_prefix = strapon_logger_prefix + "."
+        self._encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"), default=str)
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: dict[str, Any] = {
+            "time": record.created,
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if strapon_id := _strapon_of_logger(record.name, self.strapon_logger_prefix):
+            entry["strapon"] = strapon_id
+        if context := getattr(record, "harness_context", None):
+            entry.update(context)
+        if record.exc_info and record.exc_info[1] is not None:
+            # Other handlers may have already formatted the traceback
+            if not record.exc_text:
+                record.exc_text = self.formatException(record.exc_info)
+            entry["exception"] = {
+                "type": type(record.exc_info[1]).__qualname__,
+                "message": str(record.exc_info[1]),
+                "traceback": record.exc_text,
+            }
+        elif record.exc_text:  # The exception itself doesn't survive being sent through a queue
+            entry["exception"] = {"traceback": record.exc_text}
+        if record.stack_info:
+            entry["stack"] = record.stack_info
+        return self._encoder.encode(entry)
+
+
+class JsonLogHandler(RotatingLogHandler):
+    """A :class:`RotatingLogHandler` writing ``.jsonl`` files with a :class:`JsonFormatter`."""
+
+    def __init__(self, logs_dir: Path, strapon_logger_prefix: str) -> None:
+        logs_dir.mkdir(parents=True, exist_ok=True)
+        super().__init__(logs_dir, suffix=".jsonl")
+        self.setFormatter(JsonFormatter(strapon_logger_prefix))
+
+    def _read_log_date(self, log_file: Path) -> str:
+        with log_file.open(encoding="utf-8") as file:
+            first_line = file.readline()
+        try:
+            created = json.loads(first_line)["time"]
+            return datetime.datetime.fromtimestamp(created).strftime(LOG_DATE_FORMAT)
+        except (ValueError, KeyError, TypeError, OverflowError, OSError):
+            _log.warning(f"Invalid first record in log file: {log_file.name}")
+            return "INVALID"
+
+
+class _Repeats:
+    __slots__ = ("count", "expires_at", "message", "record")
+
+    def __init__(self, message: str, expires_at: float) -> None:
+        self.message = message  # Of the first record, as the summary is for the ones after it
+        self.expires_at = expires_at
+        self.count = 0
+        # Kept without exception info, so tracebacks and their frames aren't held on to
+        self.record: logging.LogRecord | None = None
+
+
+class _TokenBucket:
+    __slots__ = ("dropped", "tokens", "updated_at")
+
+    def __init__(self, tokens: float, now: float) -> None:
+        self.tokens = tokens
+        self.updated_at = now
+        self.dropped = 0
+
+
+def _exception_location(record: logging.LogRecord) -> tuple[str, str, int] | None:
+    if not record.exc_info or record.exc_info[1] is None:
+        return None
+    traceback = record.exc_info[2]
+    if traceback is None:
+        return type(record.exc_info[1]).__qualname__, "", 0
+    while traceback.tb_next is not None:
+        traceback = traceback.tb_next
+    return type(record.exc_info[1]).__qualname__, traceback.tb_frame.f_code.co_filename, traceback.tb_lineno
+
+
+class RateLimitFilter(logging.Filter):
+    """Merges repeats of a record into a summary, and limits how many records each logger can emit.
+
+    Records are repeats when they have the same logger, message template and exception location. Within
+    ``dedup_interval`` seconds of the first one, repeats are only counted, and logged as a single "(and N similar)"
+    record once the interval is over. Each logger also gets a token bucket, allowing ``burst`` records at once and
+    ``rate`` records per second after that. Summaries are emitted as later records come in, or on :meth:`flush`.
+
+    The same filter can be added to several handlers, as the decision is stored on the record.
+    """
+
+    def __init__(self, *, dedup_interval: float = 0, rate: float = 0, burst: int = 0) -> None:
+        """
+        :param dedup_interval: Seconds to merge repeats for. 0 disables merging.
+        :param rate: Records per second each logger may emit. 0 disables rate limiting.
+        :param burst: Records each logger may emit at once, at least 1 when rate limiting.
+        """
+        super().__init__()
+        self.dedup_interval = dedup_interval
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._lock = threading.Lock()
+        self._repeats: dict[tuple[Any, ...], _Repeats] = {}
+        self._buckets: dict[str, _TokenBucket] = {}
+        self._next_sweep = 0.0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if (allowed := getattr(record, "harness_rate_limit_allowed", None)) is not None:
+            return allowed
+        now = time.monotonic()
+        with self._lock:
+            allowed = self._allow(record, now)
+            summaries = self._sweep(now) if now >= self._next_sweep else []
+        record.harness_rate_limit_allowed = allowed
+        for summary in summaries:
+            logging.getLogger(summary.name).handle(summary)
+        return allowed
+
+    def _allow(self, record: logging.LogRecord, now: float) -> bool:
+        if self.dedup_interval:
+            key = (record.name, record.levelno, str(record.msg), _exception_location(record))
+            if (repeats := self._repeats.get(key)) is not None:
+                if repeats.record is None:
+                    repeats.record = self._summary(record, repeats.message)
+                repeats.count += 1
+                return False
+            self._repeats[key] = _Repeats(record.getMessage(), now + self.dedup_interval)
+        return self._take_token(record.name, now)
+
+    def _take_token(self, logger_name: str, now: float) -> bool:
+        if not self.rate:
+            return True
+        if (bucket := self._buckets.get(logger_name)) is None:
+            bucket = self._buckets[logger_name] = _TokenBucket(self.burst, now)
+        bucket.tokens = min(self.burst, bucket.tokens + (now - bucket.updated_at) * self.rate)
+        bucket.updated_at = now
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            return True
+        bucket.dropped += 1
+        return False
+
+    def _sweep(self, now: float, *, everything: bool = False) -> list[logging.LogRecord]:
+        self._next_sweep = now + 1
+        summaries: list[logging.LogRecord] = []
+        for key, repeats in list(self._repeats.items()):
+            if not everything and repeats.expires_at > now:
+                continue
+            del self._repeats[key]
+            if repeats.record is not None:
+                summaries.append(self._summary(
+                    repeats.record,
+                    f"{repeats.message} (and {repeats.count} similar)",
+                ))
+        for logger_name, bucket in list(self._buckets.items()):
+            if bucket.dropped and (everything or bucket.tokens + (now - bucket.updated_at) * self.rate >= 1):
+                summaries.append(self._summary(
+                    logging.LogRecord(logger_name, logging.WARNING, "", 0, "", None, None),
+                    f"Rate limited {bucket.dropped} records from {logger_name}",
+                ))
+                bucket.dropped = 0
+            elif not bucket.dropped and now - bucket.updated_at > self.burst / self.rate:
+                del self._buckets[logger_name]  # Full again, same as a new one
+        return summaries
+
+    @staticmethod
+    def _summary(record: logging.LogRecord, message: str) -> logging.LogRecord:
+        summary = copy.copy(record)
+        summary.msg = message
+        summary.args = None
+        summary.exc_info = None
+        summary.exc_text = None
+        summary.created = time.time()
+        summary.msecs = summary.created % 1 * 1000
+        summary.harness_rate_limit_allowed = True
+        return summary
+
+    def flush(self) -> None:
+        """Emit summaries for everything held back so far."""
+        with self._lock:
+            summaries = self._sweep(time.monotonic(), everything=True)
+        for summary in summaries:
+            logging.getLogger(summary.name).handle(summary)
+
+
+class BufferedRecord:
+    __slots__ = ("created", "exception", "levelno", "message", "name", "strapon")
+
+    def __init__(
+        self,
+        created: float,
+        levelno: int,
+        name: str,
+        message: str,
+        *,
+        strapon: str | None,
+        exception: str | None,
+    ) -> None:
+        self.created = created
+        self.levelno = levelno
+        self.name = name
+        self.message = message
+        self.strapon = strapon
+        self.exception = exception
+
+
+class RingBufferHandler(logging.Handler):
+    """Keeps the last ``capacity`` records in memory, so recent logs can be looked at without reading log files.
+
+    Only the message and a one-line summary of any exception are kept, not the record itself.
+    """
+
+    def __init__(self, capacity: int, strapon_logger_prefix: str) -> None:
+        super().__init__()
+        self.strapon_logger_prefix = strapon_logger_prefix + "."
+        self._records: collections.deque[BufferedRecord] = collections.deque(maxlen=capacity)
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            exception = None
+            if record.exc_info and record.exc_info[1] is not None:
+                exception = f"{type(record.exc_info[1]).__qualname__}: {record.exc_info[1]}"
+            elif record.exc_text:  # The exception itself doesn't survive being sent through a queue
+                exception = record.exc_text.rstrip().rpartition("\n")[2]
+            self._records.append(BufferedRecord(
+                record.created,
+                record.levelno,
+                record.name,
+                record.getMessage(),
+                strapon=_strapon_of_logger(record.name, self.strapon_logger_prefix),
+                exception=exception,
+            ))
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def query(
+        self,
+        *,
+        level: int = logging.NOTSET,
+        logger: str | None = None,
+        strapon: str | None = None,
+        limit: int | None = None,
+    ) -> list[BufferedRecord]:
+        """Get the newest buffered records matching all given filters, oldest first.
+
+        :param level: Minimum level of the records.
+        :param logger: Only include records from this logger and its children.
+        :param strapon: Only include records from the loggers of this strapon.
+        :param limit: Maximum amount of records to return.
+        """
+        with self.lock:  # pyright: ignore [reportOptionalContextManager]
+            records = list(self._records)
+        matches: list[BufferedRecord] = []
+        for record in reversed(records):
+            if limit is not None and len(matches) >= limit:
+                break
+            if record.levelno < level or (strapon is not None and record.strapon != strapon):
+                continue
+            if logger is not None and record.name != logger and not record.name.startswith(f"{logger}."):
+                continue
+            matches.append(record)
+        matches.reverse()
+        return matches